@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, List, Optional
+import asyncpg
+from .database import engine
+from .schema import PORTFOLIO_STATS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_CACHE_TTL = float(os.getenv('PORTFOLIO_CACHE_TTL', '1.0'))
+LISTENER_RETRY_SECONDS = 5
+
+MISSING = object()
+
+
+class TTLCache:
+    """Single-value cache with a TTL and explicit invalidation."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._value: Any = MISSING
+        self._expires_at = 0.0
+        self._generation = 0
+
+    def get(self) -> Any:
+        if self._value is not MISSING and time.monotonic() < self._expires_at:
+            self.hits += 1
+            return self._value
+        self.misses += 1
+        return MISSING
+
+    def generation(self) -> int:
+        return self._generation
+
+    def set(self, value: Any, generation: Optional[int] = None):
+        # A value read before an invalidation must not overwrite it
+        if generation is not None and generation != self._generation:
+            return
+        self._value = value
+        self._expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self):
+        self._generation += 1
+        self._value = MISSING
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+portfolio_value_cache = TTLCache(PORTFOLIO_CACHE_TTL)
+
+
+def listener_dsn() -> str:
+    # asyncpg.connect wants a plain postgresql:// DSN, not the SQLAlchemy dialect URL
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class NotificationListener:
+    """Dedicated LISTEN connection, outside the pool, that reconnects if it drops."""
+
+    def __init__(self, channel: str, *callbacks: Callable[[], None]):
+        self.channel = channel
+        self.callbacks = list(callbacks)
+        self.payload_callbacks: List[Callable[[Optional[str]], None]] = []
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+
+    def add_callback(self, callback: Callable[[], None]):
+        self.callbacks.append(callback)
+
+    def add_payload_callback(self, callback: Callable[[Optional[str]], None]):
+        """Called with the NOTIFY payload, or None when no single notification applies."""
+        self.payload_callbacks.append(callback)
+
+    def on_notify(self, payload: Optional[str] = None):
+        for callback in self.callbacks:
+            callback()
+        for callback in self.payload_callbacks:
+            callback(payload)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(listener_dsn(), timeout=5)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(self.channel, lambda _connection, _pid, _channel, payload: self.on_notify(payload))
+                self.connected = True
+                # Anything cached while we were not listening may be stale
+                self.on_notify()
+                await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("LISTEN %s failed: %s", self.channel, e)
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+
+
+portfolio_stats_listener = NotificationListener(PORTFOLIO_STATS_CHANNEL, portfolio_value_cache.invalidate)
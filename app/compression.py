@@ -0,0 +1,341 @@
+import gzip
+import os
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # optional codec; negotiation skips it
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional codec; negotiation skips it
+    zstandard = None
+
+# Bodies smaller than this go out as-is; the framing overhead is not worth it
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+# Bodies (or streamed chunks) at least this large are compressed in the thread pool
+COMPRESS_THREAD_MIN_SIZE = int(os.getenv('COMPRESS_THREAD_MIN_SIZE', str(256 * 1024)))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+ZSTD_LEVEL = int(os.getenv('ZSTD_LEVEL', '3'))
+# Compressed bodies kept for responses with a strong ETag
+COMPRESSED_CACHE_BYTES = int(os.getenv('COMPRESSED_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/plain",
+    "text/html",
+)
+
+
+class GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Sync flush so each streamed chunk reaches the client as it is produced
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+class ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        # ZstdCompressor is not safe to share across threads, so one per call
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+# Server preference when the client weights codings equally
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS = {"br": BrotliEncoder, **ENCODERS}
+if zstandard is not None:
+    ENCODERS = {"zstd": ZstdEncoder, **ENCODERS}
+PREFERENCE = {name: rank for rank, name in enumerate(ENCODERS)}
+
+_negotiated: Dict[str, Optional[str]] = {}
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported coding from an Accept-Encoding header, or None for identity."""
+    try:
+        return _negotiated[accept_encoding]
+    except KeyError:
+        pass
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name == "*":
+            for coding in ENCODERS:
+                weights.setdefault(coding, q)
+        elif name in ENCODERS:
+            weights[name] = q
+    candidates = [(q, -PREFERENCE[name], name) for name, q in weights.items() if q > 0]
+    choice = max(candidates)[2] if candidates else None
+    # Clients send a handful of distinct headers; keep the cache from growing on junk
+    if len(_negotiated) < 1000:
+        _negotiated[accept_encoding] = choice
+    return choice
+
+
+def request_encoding(request: Request) -> Optional[str]:
+    header = request.headers.get("accept-encoding")
+    return negotiate(header) if header else None
+
+
+def weak_etag(etag: str) -> str:
+    # A strong ETag names exact bytes; the encoded body is a different representation
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+class CompressionStats:
+    def __init__(self):
+        self.responses: Dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.offloaded = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+compression_stats = CompressionStats()
+
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by (strong ETag, coding), bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = COMPRESSED_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    def get(self, etag: str, encoding: str) -> Optional[bytes]:
+        body = self._entries.get((etag, encoding))
+        if body is None:
+            compression_stats.cache_misses += 1
+            return None
+        self._entries.move_to_end((etag, encoding))
+        compression_stats.cache_hits += 1
+        return body
+
+    def put(self, etag: str, encoding: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        previous = self._entries.pop((etag, encoding), None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._entries[(etag, encoding)] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+compressed_cache = CompressedCache()
+
+
+def cached_response(request: Request, etag: str, media_type: str = "application/json",
+                    headers: Optional[dict] = None) -> Optional[Response]:
+    """Already-compressed response for `etag` if one is cached for the client's coding.
+
+    Lets a handler that knows its ETag skip building and compressing the body again.
+    """
+    encoding = request_encoding(request)
+    if encoding is None:
+        return None
+    body = compressed_cache.get(etag, encoding)
+    if body is None:
+        return None
+    return Response(content=body, media_type=media_type, headers={
+        **(headers or {}),
+        "ETag": weak_etag(etag),
+        "Content-Encoding": encoding,
+        "Vary": "Accept-Encoding",
+    })
+
+
+def _compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware negotiating zstd, brotli or gzip from Accept-Encoding.
+
+    Single-message bodies under COMPRESS_MIN_SIZE are sent as-is; streamed bodies are
+    compressed chunk by chunk, except server-sent events. Work on large bodies runs in
+    the thread pool (the codecs release the GIL). Bodies that carry a strong ETag are
+    kept in `compressed_cache` so handlers can serve them again via `cached_response`.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = None
+        for name, value in scope.get("headers", ()):
+            if name == b"accept-encoding":
+                encoding = negotiate(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        kind = message["type"]
+        if kind == "http.response.start":
+            headers = MutableHeaders(raw=list(message.get("headers", ())))
+            message["headers"] = headers.raw
+            if not _compressible(headers):
+                # Sent straight away so event streams and other uncompressed bodies are not delayed
+                etag = headers.get("etag")
+                if etag is not None and message["status"] == 304:
+                    headers["etag"] = weak_etag(etag)
+                self.passthrough = True
+                await self.send(message)
+                return
+            # Held until the first body message shows whether the body is big enough
+            self.start = message
+            return
+        if kind != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+        if self.encoder is not None:
+            await self._send_chunk(message)
+            return
+
+        headers = MutableHeaders(raw=self.start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        etag = headers.get("etag")
+        if not more_body and len(body) < self.minimum_size:
+            if etag is not None and self.start["status"] == 304:
+                headers["etag"] = weak_etag(etag)
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if etag is not None:
+            headers["etag"] = weak_etag(etag)
+
+        compression_stats.responses[self.encoding] = compression_stats.responses.get(self.encoding, 0) + 1
+        encoder_class = ENCODERS[self.encoding]
+        if more_body:
+            # Length is unknown until the stream ends
+            del headers["content-length"]
+            self.encoder = encoder_class()
+            await self.send(self.start)
+            await self._send_chunk(message)
+            return
+
+        if len(body) >= COMPRESS_THREAD_MIN_SIZE:
+            compression_stats.offloaded += 1
+            compressed = await run_in_threadpool(encoder_class.compress, body)
+        else:
+            compressed = encoder_class.compress(body)
+        if etag is not None and not etag.startswith("W/"):
+            compressed_cache.put(etag, self.encoding, compressed)
+        self._count(len(body), len(compressed))
+        headers["content-length"] = str(len(compressed))
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": compressed})
+
+    async def _send_chunk(self, message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if len(body) >= COMPRESS_THREAD_MIN_SIZE:
+            compression_stats.offloaded += 1
+            data = await run_in_threadpool(self.encoder.chunk, body) if body else b""
+        else:
+            data = self.encoder.chunk(body) if body else b""
+        if not more_body:
+            data += self.encoder.finish()
+        self._count(len(body), len(data))
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _count(self, bytes_in: int, bytes_out: int):
+        compression_stats.bytes_in += bytes_in
+        compression_stats.bytes_out += bytes_out
+
+
+@metrics.register
+def compression_metrics():
+    yield from metrics.metric("http_compressed_responses_total", "counter", "Compressed responses by coding.", [
+        ({"encoding": encoding}, count) for encoding, count in sorted(compression_stats.responses.items())
+    ])
+    yield from metrics.metric("http_compression_bytes_in_total", "counter", "Body bytes before compression.", compression_stats.bytes_in)
+    yield from metrics.metric("http_compression_bytes_out_total", "counter", "Body bytes after compression.", compression_stats.bytes_out)
+    yield from metrics.metric("http_compression_offloaded_total", "counter", "Compressions run in the thread pool.", compression_stats.offloaded)
+    yield from metrics.metric("http_compressed_cache_hits_total", "counter", "Responses served from cached compressed bytes.", compression_stats.cache_hits)
+    yield from metrics.metric("http_compressed_cache_misses_total", "counter", "Compressed cache lookups that missed.", compression_stats.cache_misses)
+    yield from metrics.metric("http_compressed_cache_bytes", "gauge", "Bytes held by the compressed response cache.", compressed_cache.size)
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from typing import Optional
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from . import metrics
+from .querystats import query_stats
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file if it exists
+load_dotenv()
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Seconds before a pooled connection is replaced; -1 keeps connections indefinitely
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '-1'))
+# Seconds between background pings of idle connections; 0 disables the validator
+DB_POOL_VALIDATE_INTERVAL = float(os.getenv('DB_POOL_VALIDATE_INTERVAL', '0'))
+# With the validator on, checkouts skip the per-checkout ping unless asked for explicitly
+DB_POOL_PRE_PING = os.getenv(
+    'DB_POOL_PRE_PING', 'false' if DB_POOL_VALIDATE_INTERVAL > 0 else 'true'
+).lower() in ('1', 'true', 'yes')
+DB_POOL_WARM = int(os.getenv('DB_POOL_WARM', str(DB_POOL_SIZE)))
+
+
+def to_async_url(url: str) -> str:
+    # Deployments hand us a plain postgresql:// URL; route it through asyncpg
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+class PoolStats:
+    def __init__(self):
+        self.connections_created = 0
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+        self.validated = 0
+        self.evicted = 0
+        self.retries = 0
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited, including connection setup."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            pool_stats.checkouts += 1
+            pool_stats.checkout_wait_total += waited
+            pool_stats.checkout_wait_max = max(pool_stats.checkout_wait_max, waited)
+
+
+# SQLAlchemy logs pool lifecycle at INFO under the pool class's own name; keep it at
+# the library's default level now that the root logger handles INFO
+logging.getLogger(f"{__name__}.{InstrumentedPool.__name__}").setLevel(logging.WARNING)
+
+engine = create_async_engine(
+    to_async_url(DATABASE_URL),
+    connect_args={
+        "timeout": 5
+    },
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING
+)
+
+
+@event.listens_for(engine.sync_engine.pool, "connect")
+def count_connection(dbapi_connection, connection_record):
+    pool_stats.connections_created += 1
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["statement_started"].pop()
+    metrics.record_db_time(elapsed)
+    query_stats.record(statement, parameters, executemany, elapsed)
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def drop_statement_timer(exception_context):
+    # Failed statements never reach after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("statement_started"):
+        elapsed = time.perf_counter() - connection.info["statement_started"].pop()
+        metrics.record_db_time(elapsed)
+        context = exception_context.execution_context
+        query_stats.record(
+            exception_context.statement or "",
+            exception_context.parameters,
+            context.executemany if context is not None else False,
+            elapsed,
+        )
+
+
+async def warm_pool(count: int = DB_POOL_WARM):
+    """Open `count` connections at once so the first requests skip TCP/TLS/auth setup."""
+    count = min(count, DB_POOL_SIZE)
+    if count <= 0:
+        return
+    connections = [engine.connect() for _ in range(count)]
+    results = await asyncio.gather(*(c.start() for c in connections), return_exceptions=True)
+    await asyncio.gather(*(c.close() for c in connections), return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        logger.warning("Pool warm-up opened %d/%d connections: %s", count - len(failures), count, failures[0])
+
+
+class PoolValidator:
+    """Pings idle pooled connections in the background and evicts the dead ones.
+
+    Only connections already idle in the pool are checked, so it never opens new ones,
+    and each is held only for its ping.
+    """
+
+    def __init__(self, interval: float = DB_POOL_VALIDATE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def validate(self):
+        # The queue pool hands out idle connections FIFO, so checking out one at a time
+        # and returning it walks the idle set once
+        for _ in range(engine.sync_engine.pool.checkedin()):
+            connection = engine.connect()
+            try:
+                await connection.start()
+                await connection.execute(text("SELECT 1"))
+                pool_stats.validated += 1
+            except Exception as e:
+                pool_stats.evicted += 1
+                logger.warning("Evicted dead pooled connection: %s", e)
+                if not connection.closed and not connection.invalidated:
+                    await connection.invalidate()
+            finally:
+                await connection.close()
+            if engine.sync_engine.pool.checkedin() == 0:
+                break
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.validate()
+            except Exception:
+                logger.exception("Pool validation failed")
+
+
+pool_validator = PoolValidator()
+
+
+@metrics.register
+def pool_metrics():
+    pool = engine.sync_engine.pool
+    yield from metrics.metric("db_pool_size", "gauge", "Configured pool size.", pool.size())
+    yield from metrics.metric("db_pool_checked_out", "gauge", "Connections currently checked out.", pool.checkedout())
+    yield from metrics.metric("db_pool_checked_in", "gauge", "Idle connections in the pool.", pool.checkedin())
+    yield from metrics.metric("db_pool_overflow", "gauge", "Connections open beyond pool_size.", max(pool.overflow(), 0))
+    yield from metrics.metric("db_pool_connections_created_total", "counter",
+                              "Database connections opened.", pool_stats.connections_created)
+    yield from metrics.metric("db_pool_checkouts_total", "counter", "Pool checkouts.", pool_stats.checkouts)
+    yield from metrics.metric("db_pool_checkout_wait_seconds_total", "counter",
+                              "Time spent waiting for a pooled connection.", pool_stats.checkout_wait_total)
+    yield from metrics.metric("db_pool_checkout_wait_seconds_max", "gauge",
+                              "Longest wait for a pooled connection.", pool_stats.checkout_wait_max)
+    yield from metrics.metric("db_pool_validated_total", "counter",
+                              "Idle connections pinged by the background validator.", pool_stats.validated)
+    yield from metrics.metric("db_pool_evicted_total", "counter",
+                              "Dead connections evicted by the background validator.", pool_stats.evicted)
+    yield from metrics.metric("db_session_retries_total", "counter",
+                              "Statements retried on a fresh connection after a disconnect.", pool_stats.retries)
+
+
+class RetryingSession(AsyncSession):
+    """Retries the first statement of a transaction once if its connection turned out dead.
+
+    Nothing has run in the transaction yet at that point, so re-running on a fresh
+    connection is safe; this is what lets checkouts skip pre-ping.
+    """
+
+    async def execute(self, statement, params=None, **kwargs):
+        fresh = not self.in_transaction()
+        try:
+            return await super().execute(statement, params, **kwargs)
+        except DBAPIError as e:
+            if not (fresh and e.connection_invalidated):
+                raise
+            await self.rollback()
+            pool_stats.retries += 1
+            return await super().execute(statement, params, **kwargs)
+
+
+SessionLocal = async_sessionmaker(engine, class_=RetryingSession, expire_on_commit=False)
+
+
+async def get_session():
+    async with SessionLocal() as session:
+        yield session
@@ -0,0 +1,29 @@
+import hashlib
+from fastapi import Request, Response
+
+# Clients may cache but must revalidate, which is what makes If-None-Match pollers cheap
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from a version marker plus whatever else shapes the representation."""
+    return '"' + hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    candidates = (c.strip() for c in header.split(","))
+    return any((c[2:] if c.startswith("W/") else c) == etag for c in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
@@ -0,0 +1,168 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+from . import metrics
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Records waiting for the writer thread; further records are dropped and counted
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Each distinct message may log this many records per window before sampling starts
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', '10'))
+LOG_RATE_WINDOW = float(os.getenv('LOG_RATE_WINDOW', '10'))
+# Past the limit, keep one record in this many
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '100'))
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class LogStats:
+    def __init__(self):
+        self.dropped = 0
+        self.suppressed = 0
+
+
+log_stats = LogStats()
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets each warning/error template through LOG_RATE_LIMIT times per window, then samples.
+
+    Keyed on the unformatted message and exception class, so an error storm from one
+    handler costs a dict lookup per record rather than a write. The next record that
+    gets through reports how many were suppressed before it.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW,
+                 sample_every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sample_every = sample_every
+        # key -> [window start, records seen in window, suppressed since last emit]
+        self._seen: Dict[Tuple[Any, ...], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        error = record.exc_info[0] if record.exc_info else None
+        key = (record.name, record.msg, error)
+        now = time.monotonic()
+        state = self._seen.get(key)
+        if state is None or now - state[0] >= self.window:
+            if len(self._seen) > 10000:
+                self._seen.clear()
+            state = self._seen[key] = [now, 0, state[2] if state is not None else 0]
+        state[1] += 1
+        if state[1] > self.limit and (state[1] - self.limit) % self.sample_every:
+            state[2] += 1
+            log_stats.suppressed += 1
+            return False
+        if state[2]:
+            record.suppressed = state[2]
+            state[2] = 0
+        return True
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the current request's id, route and DB time on the calling task."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request = metrics.current_request()
+        if request is not None:
+            record.request_id = request.request_id
+            record.route = request.route
+            record.db_ms = round(request.db_time * 1000, 3)
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread without formatting them or blocking on a full queue."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message now (its args may change), but leave exc_info for the
+        # writer thread to format; the queue never leaves this process.
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info and record.exc_info[0] is not None:
+            entry["error"] = record.exc_info[0].__name__
+            entry["error_message"] = str(record.exc_info[1])
+            entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+
+def setup_logging(stream=None, level: str = LOG_LEVEL) -> QueueListener:
+    """Route the root logger through a bounded queue to a JSON writer thread. Idempotent."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        # Skip the caller lookup and thread/process fields on every record; the JSON
+        # output does not use them (see "Optimization" in the logging HOWTO)
+        logging._srcfile = None
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        # Rate limiting first so suppressed records skip the context lookup
+        handler.addFilter(RateLimitFilter())
+        handler.addFilter(RequestContextFilter())
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+        _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+@metrics.register
+def logging_metrics():
+    yield from metrics.metric("log_records_dropped_total", "counter", "Log records dropped because the queue was full.", log_stats.dropped)
+    yield from metrics.metric("log_records_suppressed_total", "counter", "Log records suppressed by rate limiting.", log_stats.suppressed)
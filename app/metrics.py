@@ -0,0 +1,198 @@
+import bisect
+import contextvars
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# Starlette appends the charset for text/* media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+Sample = Tuple[Dict[str, str], float]
+
+_collectors: List[Callable[[], Iterable[str]]] = []
+
+
+def register(collector: Callable[[], Iterable[str]]):
+    """Add a callable that yields exposition lines each time /metrics is scraped."""
+    _collectors.append(collector)
+    return collector
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def metric(name: str, kind: str, help_text: str, samples: Union[float, Iterable[Sample]]) -> List[str]:
+    """Format one metric family in the Prometheus text exposition format."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    if isinstance(samples, (int, float)):
+        samples = [({}, samples)]
+    lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in samples)
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+# Seconds; shared by request latency and per-request database time
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf, allocated up front
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: Dict[str, str]) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+class RouteStats:
+    __slots__ = ("statuses", "latency", "db_time")
+
+    def __init__(self):
+        self.statuses: Dict[int, int] = {}
+        self.latency = Histogram()
+        self.db_time = Histogram()
+
+
+_routes: Dict[Tuple[str, str], RouteStats] = {}
+_in_flight = [0]
+
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+def _incoming_request_id(scope) -> Optional[str]:
+    # Keep the caller's id so logs line up across services; cap it to bound log size
+    for name, value in scope.get("headers", ()):
+        if name == REQUEST_ID_HEADER:
+            return value[:64].decode("latin-1")
+    return None
+
+
+class RequestContext:
+    """Per-request state visible to code running under the request (e.g. engine events)."""
+
+    __slots__ = ("scope", "request_id", "db_time")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.request_id = _incoming_request_id(scope) or os.urandom(8).hex()
+        self.db_time = 0.0
+
+    @property
+    def route(self) -> str:
+        # Set by FastAPI once routing has matched
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+
+_current_request: contextvars.ContextVar[Optional[RequestContext]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+def current_request() -> Optional[RequestContext]:
+    return _current_request.get()
+
+
+def record_db_time(seconds: float):
+    """Called from the engine's cursor events; attributes statement time to the current request."""
+    request = _current_request.get()
+    if request is not None:
+        request.db_time += seconds
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route counts, status codes, latency and DB time.
+
+    Also assigns each request an id (the caller's X-Request-ID if sent), echoed on the
+    response and attached to log records.
+
+    Routes are labelled by their path template (scope["route"], set by FastAPI while
+    routing), so path parameters do not create new series; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+        request = RequestContext(scope)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = [
+                    *message.get("headers", ()), (REQUEST_ID_HEADER, request.request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = _current_request.set(request)
+        _in_flight[0] += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_flight[0] -= 1
+            _current_request.reset(token)
+            key = (scope["method"], request.route)
+            stats = _routes.get(key)
+            if stats is None:
+                stats = _routes[key] = RouteStats()
+            stats.statuses[status[0]] = stats.statuses.get(status[0], 0) + 1
+            stats.latency.observe(elapsed)
+            stats.db_time.observe(request.db_time)
+
+
+@register
+def http_metrics():
+    yield from metric("http_requests_in_flight", "gauge", "Requests currently being served.", _in_flight[0])
+    routes = sorted(_routes.items())
+    yield from metric("http_requests_total", "counter", "Requests by route and status code.", [
+        ({"method": method, "route": path, "status": str(status)}, count)
+        for (method, path), stats in routes
+        for status, count in sorted(stats.statuses.items())
+    ])
+    yield "# HELP http_request_duration_seconds Request latency by route."
+    yield "# TYPE http_request_duration_seconds histogram"
+    for (method, path), stats in routes:
+        yield from stats.latency.samples("http_request_duration_seconds", {"method": method, "route": path})
+    yield "# HELP http_request_db_seconds Database time spent per request, by route."
+    yield "# TYPE http_request_db_seconds histogram"
+    for (method, path), stats in routes:
+        yield from stats.db_time.samples("http_request_db_seconds", {"method": method, "route": path})
@@ -0,0 +1,20 @@
+import json
+from typing import AsyncIterator
+from fastapi import Request
+
+
+async def iter_ndjson(request: Request) -> AsyncIterator[list]:
+    """Parse an NDJSON request body as it arrives, yielding the objects from each chunk."""
+    pending = b""
+    async for chunk in request.stream():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        items = [json.loads(line) for line in lines if line.strip()]
+        if items:
+            yield items
+    if pending.strip():
+        yield [json.loads(pending)]
+
+
+def is_ndjson(request: Request) -> bool:
+    return "ndjson" in request.headers.get("content-type", "")
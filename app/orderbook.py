@@ -0,0 +1,202 @@
+import heapq
+import itertools
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+BUY = "buy"
+SELL = "sell"
+
+
+class Order:
+    __slots__ = ("order_id", "user_id", "portfolio_id", "symbol", "side", "price", "quantity", "seq")
+
+    def __init__(self, order_id, user_id: int, portfolio_id: int, symbol: str, side: str,
+                 price: Optional[float], quantity: int, seq: int = 0):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.portfolio_id = portfolio_id
+        self.symbol = symbol
+        self.side = side
+        # None for market orders
+        self.price = price
+        self.quantity = quantity
+        self.seq = seq
+
+
+class Fill:
+    __slots__ = ("symbol", "price", "quantity", "maker", "taker")
+
+    def __init__(self, symbol: str, price: float, quantity: int, maker: Order, taker: Order):
+        self.symbol = symbol
+        self.price = price
+        self.quantity = quantity
+        self.maker = maker
+        self.taker = taker
+
+    def as_dict(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "price": self.price,
+            "quantity": self.quantity,
+            "maker_order_id": str(self.maker.order_id),
+            "taker_order_id": str(self.taker.order_id),
+            "taker_side": self.taker.side
+        }
+
+
+class PriceLevel:
+    __slots__ = ("price", "orders", "quantity", "cancelled")
+
+    def __init__(self, price: float):
+        self.price = price
+        self.orders: Deque[Order] = deque()
+        self.quantity = 0
+        # Cancelled orders still in `orders`, zeroed in place
+        self.cancelled = 0
+
+    def compact(self):
+        self.orders = deque(o for o in self.orders if o.quantity > 0)
+        self.cancelled = 0
+
+
+class OrderBook:
+    """Limit order book for one symbol with price-time priority.
+
+    Each side is a dict of price -> FIFO level plus a heap of level prices (negated for
+    bids), so the best level is a heap peek and adding a level is O(log levels).
+    Cancels zero the order in place and are skipped when they reach the front; a level
+    is compacted once its cancelled entries outnumber its live ones, so add/cancel churn
+    cannot grow it without bound.
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self._levels = {BUY: {}, SELL: {}}
+        self._heaps = {BUY: [], SELL: []}
+        self._orders: Dict[object, Order] = {}
+
+    def _best_level(self, side: str) -> Optional[PriceLevel]:
+        heap = self._heaps[side]
+        levels = self._levels[side]
+        while heap:
+            price = -heap[0] if side == BUY else heap[0]
+            level = levels.get(price)
+            if level is not None and level.quantity > 0:
+                return level
+            # Stale heap entry or a level emptied by cancels
+            heapq.heappop(heap)
+            if level is not None and level.quantity == 0:
+                del levels[price]
+        return None
+
+    def best_bid(self) -> Optional[float]:
+        level = self._best_level(BUY)
+        return level.price if level else None
+
+    def best_ask(self) -> Optional[float]:
+        level = self._best_level(SELL)
+        return level.price if level else None
+
+    def _rest(self, order: Order):
+        levels = self._levels[order.side]
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = PriceLevel(order.price)
+            heapq.heappush(self._heaps[order.side], -order.price if order.side == BUY else order.price)
+        level.orders.append(order)
+        level.quantity += order.quantity
+        self._orders[order.order_id] = order
+
+    def add(self, order: Order) -> List[Fill]:
+        """Match an incoming order; any limit remainder rests, market remainders are dropped."""
+        fills = []
+        opposite = SELL if order.side == BUY else BUY
+        while order.quantity > 0:
+            level = self._best_level(opposite)
+            if level is None:
+                break
+            if order.price is not None and (
+                (order.side == BUY and level.price > order.price)
+                or (order.side == SELL and level.price < order.price)
+            ):
+                break
+            while order.quantity > 0 and level.orders:
+                maker = level.orders[0]
+                if maker.quantity == 0:
+                    level.orders.popleft()
+                    level.cancelled -= 1
+                    continue
+                quantity = min(order.quantity, maker.quantity)
+                maker.quantity -= quantity
+                order.quantity -= quantity
+                level.quantity -= quantity
+                fills.append(Fill(self.symbol, level.price, quantity, maker, order))
+                if maker.quantity == 0:
+                    level.orders.popleft()
+                    del self._orders[maker.order_id]
+        if order.quantity > 0 and order.price is not None:
+            self._rest(order)
+        return fills
+
+    def cancel(self, order_id) -> Optional[Order]:
+        order = self._orders.pop(order_id, None)
+        if order is None:
+            return None
+        level = self._levels[order.side][order.price]
+        level.quantity -= order.quantity
+        order.quantity = 0
+        level.cancelled += 1
+        if 2 * level.cancelled > len(level.orders):
+            level.compact()
+        return order
+
+    def depth(self, levels: int = 10) -> dict:
+        def side(name: str, reverse: bool):
+            prices = sorted((p for p, l in self._levels[name].items() if l.quantity > 0), reverse=reverse)
+            return [{"price": p, "quantity": self._levels[name][p].quantity} for p in prices[:levels]]
+
+        return {"symbol": self.symbol, "bids": side(BUY, True), "asks": side(SELL, False)}
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+
+class OrderBooks:
+    """One book per symbol plus an order_id -> symbol index for cancels."""
+
+    def __init__(self):
+        self._books: Dict[str, OrderBook] = {}
+        self._symbols: Dict[object, str] = {}
+        self._seq = itertools.count()
+
+    def get(self, symbol: str) -> Optional[OrderBook]:
+        return self._books.get(symbol)
+
+    def book(self, symbol: str) -> OrderBook:
+        book = self._books.get(symbol)
+        if book is None:
+            book = self._books[symbol] = OrderBook(symbol)
+        return book
+
+    def submit(self, order_id, user_id: int, portfolio_id: int, symbol: str, side: str,
+               price: Optional[float], quantity: int) -> List[Fill]:
+        order = Order(order_id, user_id, portfolio_id, symbol, side, price, quantity, next(self._seq))
+        fills = self.book(symbol).add(order)
+        if order.quantity > 0 and price is not None:
+            self._symbols[order_id] = symbol
+        for fill in fills:
+            if fill.maker.quantity == 0:
+                self._symbols.pop(fill.maker.order_id, None)
+        return fills
+
+    def cancel(self, order_id) -> Optional[Order]:
+        symbol = self._symbols.pop(order_id, None)
+        if symbol is None:
+            return None
+        return self._books[symbol].cancel(order_id)
+
+    def stats(self) -> dict:
+        return {"symbols": len(self._books), "resting_orders": len(self._symbols)}
+
+
+order_books = OrderBooks()
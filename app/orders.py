@@ -0,0 +1,403 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import DateTime, Float, Integer, String, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from .database import SessionLocal
+from .models import OrderCreate
+from .orderbook import BUY, Fill, order_books
+from .positions import PositionDeltas, apply_position_deltas
+from .risk import risk_engine
+from .valuation import incremental_valuer
+
+logger = logging.getLogger(__name__)
+
+ORDER_BATCH_SIZE = int(os.getenv('ORDER_BATCH_SIZE', '500'))
+ORDER_BATCH_WINDOW = float(os.getenv('ORDER_BATCH_WINDOW_MS', '2')) / 1000
+ORDER_QUEUE_SIZE = int(os.getenv('ORDER_QUEUE_SIZE', '50000'))
+FILL_BATCH_WINDOW = float(os.getenv('FILL_BATCH_WINDOW_MS', '2')) / 1000
+# Seconds between attempts to persist fill deltas whose first write failed
+FILL_RETRY_SECONDS = float(os.getenv('FILL_RETRY_SECONDS', '1'))
+
+INSERT_ORDERS_SQL = text("""
+    INSERT INTO orders (order_id, user_id, portfolio_id, symbol, side, quantity, order_type, limit_price, created_at)
+    SELECT * FROM unnest(
+        :order_ids, :user_ids, :portfolio_ids, :symbols, :sides, :quantities, :order_types, :limit_prices, :created_ats
+    )
+""").bindparams(
+    bindparam("order_ids", type_=ARRAY(UUID(as_uuid=True))),
+    bindparam("user_ids", type_=ARRAY(Integer)),
+    bindparam("portfolio_ids", type_=ARRAY(Integer)),
+    bindparam("symbols", type_=ARRAY(String)),
+    bindparam("sides", type_=ARRAY(String)),
+    bindparam("quantities", type_=ARRAY(Integer)),
+    bindparam("order_types", type_=ARRAY(String)),
+    bindparam("limit_prices", type_=ARRAY(Float)),
+    bindparam("created_ats", type_=ARRAY(DateTime))
+)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class OrderBatchWriter:
+    """Persists accepted orders in micro-batches.
+
+    Orders wait in an in-process queue; a single writer takes whatever has arrived within
+    ORDER_BATCH_WINDOW (or ORDER_BATCH_SIZE orders, whichever comes first), inserts the
+    batch in one statement and one commit, then resolves every submitter's future.
+    """
+
+    def __init__(self, batch_size: int = ORDER_BATCH_SIZE, window: float = ORDER_BATCH_WINDOW,
+                 queue_size: int = ORDER_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.window = window
+        self.queue_size = queue_size
+        self.batches = 0
+        self.orders = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # Let queued orders reach the database before shutting down
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, order: dict):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((order, future))
+        except asyncio.QueueFull:
+            raise QueueFull("Order queue is full")
+        await future
+
+    async def _collect(self) -> List[Tuple[dict, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write([order for order, _ in batch])
+                self.batches += 1
+                self.orders += len(batch)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+            except Exception as e:
+                logger.exception("Failed to persist order batch")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, orders: List[dict]):
+        async with SessionLocal() as session:
+            await session.execute(
+                INSERT_ORDERS_SQL,
+                {
+                    "order_ids": [o["order_id"] for o in orders],
+                    "user_ids": [o["user_id"] for o in orders],
+                    "portfolio_ids": [o["portfolio_id"] for o in orders],
+                    "symbols": [o["symbol"] for o in orders],
+                    "sides": [o["side"] for o in orders],
+                    "quantities": [o["quantity"] for o in orders],
+                    "order_types": [o["order_type"] for o in orders],
+                    "limit_prices": [o["limit_price"] for o in orders],
+                    "created_ats": [o["created_at"] for o in orders]
+                }
+            )
+            await session.commit()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "orders": self.orders,
+            "mean_batch_size": self.orders / self.batches if self.batches else 0,
+        }
+
+
+order_writer = OrderBatchWriter()
+
+
+async def submit_order(order: OrderCreate) -> dict:
+    """Validate and durably accept an order; returns once its batch has committed."""
+    if order.order_type == "limit" and order.limit_price is None:
+        raise ValueError("Limit orders require a limit_price")
+    if order.order_type == "market" and order.limit_price is not None:
+        raise ValueError("Market orders do not take a limit_price")
+    order_id = uuid.uuid4()
+    risk_engine.check(order, order_id)
+    record = {
+        "order_id": order_id,
+        "user_id": order.user_id,
+        "portfolio_id": order.portfolio_id,
+        "symbol": order.symbol,
+        "side": order.side,
+        "quantity": order.quantity,
+        "order_type": order.order_type,
+        "limit_price": order.limit_price,
+        "created_at": datetime.utcnow(),
+        # Column defaults of the inserted row, kept current by cross_order
+        "status": "accepted",
+        "filled_quantity": 0
+    }
+    try:
+        await order_writer.submit(record)
+    except BaseException:
+        # Never reaches the book, so nothing will fill or cancel it
+        risk_engine.release(order_id)
+        raise
+    return record
+
+
+def fill_deltas(fills: List[Fill]) -> PositionDeltas:
+    """Net quantity change per (portfolio_id, stock) for both sides of each fill."""
+    deltas: PositionDeltas = {}
+    for fill in fills:
+        for order in (fill.maker, fill.taker):
+            key = (order.portfolio_id, fill.symbol)
+            delta = fill.quantity if order.side == BUY else -fill.quantity
+            user_id, total = deltas.get(key, (order.user_id, 0))
+            deltas[key] = (user_id, total + delta)
+    return deltas
+
+
+# order_id -> (quantity filled since the last write, status after those fills)
+OrderFills = Dict[uuid.UUID, Tuple[int, str]]
+
+
+def order_status(order_type: str, quantity: int, filled: int) -> str:
+    if filled >= quantity:
+        return "filled"
+    if order_type == "market":
+        # The unfilled remainder of a market order is dropped, not rested
+        return "expired"
+    return "partially_filled" if filled else "accepted"
+
+
+def fill_progress(record: dict, fills: List[Fill]) -> OrderFills:
+    """Fill progress for the crossed order and every maker it hit."""
+    progress: OrderFills = {}
+    for fill in fills:
+        filled, _ = progress.get(fill.maker.order_id, (0, None))
+        # Makers rest, so one that is not used up is partially filled
+        progress[fill.maker.order_id] = (
+            filled + fill.quantity, "filled" if fill.maker.quantity == 0 else "partially_filled"
+        )
+    filled = sum(fill.quantity for fill in fills)
+    status = order_status(record["order_type"], record["quantity"], filled)
+    if status != "accepted":
+        progress[record["order_id"]] = (filled, status)
+    return progress
+
+
+# A cancel is written directly by DELETE /orders, so a fill batch landing after it must
+# not overwrite it
+UPDATE_ORDER_FILLS_SQL = text("""
+    UPDATE orders o SET
+        filled_quantity = o.filled_quantity + u.filled,
+        status = CASE WHEN o.status = 'cancelled' THEN o.status ELSE u.status END
+    FROM unnest(:order_ids, :filled, :statuses) AS u(order_id, filled, status)
+    WHERE o.order_id = u.order_id
+""").bindparams(
+    bindparam("order_ids", type_=ARRAY(UUID(as_uuid=True))),
+    bindparam("filled", type_=ARRAY(Integer)),
+    bindparam("statuses", type_=ARRAY(String))
+)
+
+
+class FillWriter:
+    """Persists fills in micro-batches: position deltas and order fill progress together.
+
+    Crossing an order only queues its fills here. A single writer merges whatever arrived
+    within FILL_BATCH_WINDOW into one transaction. The book has already matched by then,
+    so a batch that fails to commit cannot be undone there; it is merged back and retried
+    every FILL_RETRY_SECONDS until it lands, and positions catch up with the book.
+    """
+
+    def __init__(self, window: float = FILL_BATCH_WINDOW, retry_seconds: float = FILL_RETRY_SECONDS):
+        self.window = window
+        self.retry_seconds = retry_seconds
+        self.batches = 0
+        self.failures = 0
+        self._deltas: PositionDeltas = {}
+        self._orders: OrderFills = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, deltas: PositionDeltas, orders: OrderFills):
+        self._merge(deltas, orders, newer=True)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _merge(self, deltas: PositionDeltas, orders: OrderFills, newer: bool):
+        for key, (user_id, delta) in deltas.items():
+            pending_user_id, pending = self._deltas.get(key, (user_id, 0))
+            self._deltas[key] = (pending_user_id, pending + delta)
+        for order_id, (filled, status) in orders.items():
+            pending = self._orders.get(order_id)
+            if pending is None:
+                self._orders[order_id] = (filled, status)
+            else:
+                # Fill counts add up; the status from the later crossing wins
+                self._orders[order_id] = (pending[0] + filled, status if newer else pending[1])
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let a window's worth of crossings share one transaction
+            await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            if not await self._flush():
+                self._wakeup.set()
+                await asyncio.sleep(self.retry_seconds)
+
+    async def _flush(self) -> bool:
+        if not self._deltas and not self._orders:
+            return True
+        deltas, self._deltas = self._deltas, {}
+        orders, self._orders = self._orders, {}
+        try:
+            await self._write(deltas, orders)
+        except asyncio.CancelledError:
+            # Shutting down mid-write; stop() makes a last attempt
+            self._merge(deltas, orders, newer=False)
+            raise
+        except Exception:
+            # A commit whose acknowledgement was lost is applied again on retry; that is
+            # rarer than losing the fills and shows up in the failure count
+            self.failures += 1
+            logger.exception("Failed to persist fills for %d positions; retrying", len(deltas))
+            self._merge(deltas, orders, newer=False)
+            return False
+        self.batches += 1
+        return True
+
+    async def _write(self, deltas: PositionDeltas, orders: OrderFills):
+        async with SessionLocal() as session:
+            positions = await apply_position_deltas(session, deltas)
+            if orders:
+                # Sorted so concurrent batches lock order rows in the same order
+                updates = sorted(orders.items())
+                await session.execute(UPDATE_ORDER_FILLS_SQL, {
+                    "order_ids": [u[0] for u in updates],
+                    "filled": [u[1][0] for u in updates],
+                    "statuses": [u[1][1] for u in updates]
+                })
+            await session.commit()
+        incremental_valuer.on_positions(positions)
+        risk_engine.settle(deltas)
+        risk_engine.on_positions(positions)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._deltas or self._orders:
+            pending = len(self._deltas)
+            if not await self._flush():
+                logger.error("Dropping fills for %d positions that could not be persisted at shutdown", pending)
+
+    def stats(self) -> dict:
+        return {
+            "pending_fill_deltas": len(self._deltas),
+            "pending_order_fills": len(self._orders),
+            "fill_batches": self.batches,
+            "fill_write_failures": self.failures,
+        }
+
+
+fill_writer = FillWriter()
+
+
+def cross_order(record: dict) -> List[Fill]:
+    """Match an accepted order against the internal book before it is routed out.
+
+    The fills are queued for fill_writer; record gets the order's status and filled quantity.
+    """
+    fills = order_books.submit(
+        record["order_id"],
+        record["user_id"],
+        record["portfolio_id"],
+        record["symbol"],
+        record["side"],
+        record["limit_price"],
+        record["quantity"]
+    )
+    for fill in fills:
+        risk_engine.on_fill(fill.maker.order_id, fill.quantity)
+        risk_engine.on_fill(fill.taker.order_id, fill.quantity)
+    progress = fill_progress(record, fills)
+    if record["order_type"] == "market":
+        # Its unfilled remainder is dropped
+        risk_engine.release(record["order_id"])
+    if record["order_id"] in progress:
+        record["filled_quantity"], record["status"] = progress[record["order_id"]]
+    if progress:
+        fill_writer.submit(fill_deltas(fills), progress)
+    return fills
+
+
+async def place_order(order: OrderCreate) -> Tuple[dict, List[Fill]]:
+    """Accept an order into the pipeline: persist it, then cross it internally."""
+    record = await submit_order(order)
+    try:
+        fills = cross_order(record)
+    except Exception:
+        # The order is already persisted; it stays accepted without internal fills
+        logger.exception("Failed to cross order %s", record['order_id'])
+        risk_engine.release(record["order_id"])
+        fills = []
+    return record, fills
+
+
+async def cancel_order(order_id: uuid.UUID) -> bool:
+    if order_books.cancel(order_id) is None:
+        return False
+    risk_engine.release(order_id)
+    async with SessionLocal() as session:
+        await session.execute(
+            text("UPDATE orders SET status = 'cancelled' WHERE order_id = :order_id"),
+            {"order_id": order_id}
+        )
+        await session.commit()
+    return True
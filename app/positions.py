@@ -0,0 +1,134 @@
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import Integer, String, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import PositionCreate
+
+# Each column travels as one array parameter, so a batch of any size is a single
+# statement with six binds instead of one INSERT per row.
+UPSERT_POSITIONS_SQL = text("""
+    INSERT INTO positions (position_id, portfolio_id, portfolio_name, user_id, stock, quantity)
+    SELECT * FROM unnest(:position_ids, :portfolio_ids, :portfolio_names, :user_ids, :stocks, :quantities)
+    ON CONFLICT (position_id) DO UPDATE SET
+        portfolio_id = EXCLUDED.portfolio_id,
+        portfolio_name = EXCLUDED.portfolio_name,
+        user_id = EXCLUDED.user_id,
+        stock = EXCLUDED.stock,
+        quantity = EXCLUDED.quantity
+""").bindparams(
+    bindparam("position_ids", type_=ARRAY(Integer)),
+    bindparam("portfolio_ids", type_=ARRAY(Integer)),
+    bindparam("portfolio_names", type_=ARRAY(String)),
+    bindparam("user_ids", type_=ARRAY(Integer)),
+    bindparam("stocks", type_=ARRAY(String)),
+    bindparam("quantities", type_=ARRAY(Integer))
+)
+
+
+async def upsert_positions(session: AsyncSession, positions: Iterable[PositionCreate]) -> int:
+    # ON CONFLICT DO UPDATE cannot touch the same row twice in one statement; last write wins
+    latest = {p.position_id: p for p in positions}
+    if not latest:
+        return 0
+    # A consistent row order keeps concurrent batches from deadlocking on each other
+    rows = sorted(latest.values(), key=lambda p: p.position_id)
+    await session.execute(
+        UPSERT_POSITIONS_SQL,
+        {
+            "position_ids": [p.position_id for p in rows],
+            "portfolio_ids": [p.portfolio_id for p in rows],
+            "portfolio_names": [p.portfolio_name for p in rows],
+            "user_ids": [p.user_id for p in rows],
+            "stocks": [p.stock for p in rows],
+            "quantities": [p.quantity for p in rows]
+        }
+    )
+    return len(rows)
+
+
+# Positions may hold several rows per (portfolio_id, stock) and are written from outside
+# this service too, so fills add deltas in SQL instead of writing absolute quantities.
+# Rows are locked in position_id order so concurrent fill batches cannot deadlock.
+LOCK_FILL_TARGETS_SQL = text("""
+    SELECT position_id, portfolio_id, stock FROM positions
+    WHERE (portfolio_id, stock) IN (SELECT * FROM unnest(:portfolio_ids, :stocks))
+    ORDER BY position_id
+    FOR UPDATE
+""").bindparams(
+    bindparam("portfolio_ids", type_=ARRAY(Integer)),
+    bindparam("stocks", type_=ARRAY(String))
+)
+
+ADD_POSITION_DELTAS_SQL = text("""
+    UPDATE positions p SET quantity = p.quantity + d.delta
+    FROM unnest(:position_ids, :deltas) AS d(position_id, delta)
+    WHERE p.position_id = d.position_id
+    RETURNING p.position_id, p.portfolio_id, p.portfolio_name, p.user_id, p.stock, p.quantity
+""").bindparams(
+    bindparam("position_ids", type_=ARRAY(Integer)),
+    bindparam("deltas", type_=ARRAY(Integer))
+)
+
+# New rows take their id from the fill range's sequence, never from this process or a client
+INSERT_FILL_POSITIONS_SQL = text("""
+    INSERT INTO positions (position_id, portfolio_id, portfolio_name, user_id, stock, quantity)
+    SELECT nextval('positions_fill_id_seq'), d.portfolio_id,
+        COALESCE(
+            (SELECT p.portfolio_name FROM positions p WHERE p.portfolio_id = d.portfolio_id LIMIT 1),
+            'portfolio-' || d.portfolio_id
+        ),
+        d.user_id, d.stock, d.quantity
+    FROM unnest(:portfolio_ids, :user_ids, :stocks, :quantities) AS d(portfolio_id, user_id, stock, quantity)
+    RETURNING position_id, portfolio_id, portfolio_name, user_id, stock, quantity
+""").bindparams(
+    bindparam("portfolio_ids", type_=ARRAY(Integer)),
+    bindparam("user_ids", type_=ARRAY(Integer)),
+    bindparam("stocks", type_=ARRAY(String)),
+    bindparam("quantities", type_=ARRAY(Integer))
+)
+
+PositionDeltas = Dict[Tuple[int, str], Tuple[int, int]]
+
+
+async def apply_position_deltas(session: AsyncSession, deltas: PositionDeltas) -> List[PositionCreate]:
+    """Add quantity deltas keyed by (portfolio_id, stock) -> (user_id, delta); returns the rows written.
+
+    An existing key is adjusted on its lowest position_id row; a new key gets a new row.
+    The caller commits.
+    """
+    if not deltas:
+        return []
+    keys = sorted(deltas)
+    result = await session.execute(LOCK_FILL_TARGETS_SQL, {
+        "portfolio_ids": [k[0] for k in keys],
+        "stocks": [k[1] for k in keys]
+    })
+    targets: Dict[Tuple[int, str], int] = {}
+    for position_id, portfolio_id, stock in result.all():
+        targets.setdefault((portfolio_id, stock), position_id)
+
+    rows = []
+    if targets:
+        updates = sorted((position_id, deltas[key][1]) for key, position_id in targets.items())
+        result = await session.execute(ADD_POSITION_DELTAS_SQL, {
+            "position_ids": [u[0] for u in updates],
+            "deltas": [u[1] for u in updates]
+        })
+        rows.extend(result.all())
+    # Two writers may both insert a row for the same new key; rows are summed per key
+    # everywhere, so that is harmless
+    missing = [k for k in keys if k not in targets]
+    if missing:
+        result = await session.execute(INSERT_FILL_POSITIONS_SQL, {
+            "portfolio_ids": [k[0] for k in missing],
+            "user_ids": [deltas[k][0] for k in missing],
+            "stocks": [k[1] for k in missing],
+            "quantities": [deltas[k][1] for k in missing]
+        })
+        rows.extend(result.all())
+    # Rows read back from the table skip validation: fill-range ids are not valid client input
+    return [
+        PositionCreate.model_construct(position_id=r[0], portfolio_id=r[1], portfolio_name=r[2],
+                                       user_id=r[3], stock=r[4], quantity=r[5])
+        for r in rows
+    ]
@@ -0,0 +1,116 @@
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+PRICE_HISTORY_SIZE = int(os.getenv('PRICE_HISTORY_SIZE', '256'))
+PRICE_MAX_SYMBOLS = int(os.getenv('PRICE_MAX_SYMBOLS', '100000'))
+
+
+class PriceStoreFull(Exception):
+    pass
+
+
+class PriceStore:
+    """Latest quote plus a fixed-size ring buffer of recent ticks per symbol.
+
+    Symbols are rows in preallocated arrays, so memory per symbol is constant
+    (history_size prices and timestamps plus the latest quote) and a gather of many
+    symbols is a single fancy-index into the latest-price column.
+    """
+
+    def __init__(self, history_size: int = PRICE_HISTORY_SIZE, max_symbols: int = PRICE_MAX_SYMBOLS):
+        self.history_size = history_size
+        self.max_symbols = max_symbols
+        self.ticks = 0
+        self._index: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._latest = np.zeros(0)
+        self._latest_ts = np.zeros(0)
+        self._history = np.zeros((0, history_size))
+        self._history_ts = np.zeros((0, history_size))
+        self._cursor = np.zeros(0, dtype=np.int64)
+
+    def _grow(self, capacity: int):
+        def grown(array, fill):
+            out = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            out[:len(array)] = array
+            return out
+
+        self._latest = grown(self._latest, np.nan)
+        self._latest_ts = grown(self._latest_ts, np.nan)
+        self._history = grown(self._history, np.nan)
+        self._history_ts = grown(self._history_ts, np.nan)
+        self._cursor = grown(self._cursor, 0)
+
+    def _row(self, symbol: str) -> int:
+        row = self._index.get(symbol)
+        if row is not None:
+            return row
+        row = len(self._symbols)
+        if row >= self.max_symbols:
+            raise PriceStoreFull(f"Price store is full ({self.max_symbols} symbols)")
+        if row == len(self._latest):
+            self._grow(min(self.max_symbols, max(1024, 2 * row)))
+        self._index[symbol] = row
+        self._symbols.append(symbol)
+        return row
+
+    def update(self, symbol: str, price: float, timestamp: Optional[float] = None):
+        row = self._row(symbol)
+        ts = time.time() if timestamp is None else timestamp
+        slot = self._cursor[row] % self.history_size
+        self._history[row, slot] = price
+        self._history_ts[row, slot] = ts
+        self._cursor[row] += 1
+        self._latest[row] = price
+        self._latest_ts[row] = ts
+        self.ticks += 1
+
+    def update_many(self, ticks: Iterable[Tuple[str, float, Optional[float]]]):
+        for symbol, price, timestamp in ticks:
+            self.update(symbol, price, timestamp)
+
+    def latest(self, symbol: str) -> Optional[Tuple[float, float]]:
+        row = self._index.get(symbol)
+        if row is None:
+            return None
+        return float(self._latest[row]), float(self._latest_ts[row])
+
+    def gather(self, symbols: Iterable[str]) -> np.ndarray:
+        """Latest prices for many symbols at once; unknown symbols come back as NaN."""
+        rows = np.fromiter((self._index.get(s, -1) for s in symbols), dtype=np.intp)
+        prices = self._latest[np.maximum(rows, 0)] if len(self._latest) else np.full(len(rows), np.nan)
+        prices[rows < 0] = np.nan
+        return prices
+
+    def history(self, symbol: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Recent (timestamps, prices) for a symbol, oldest first."""
+        row = self._index.get(symbol)
+        if row is None:
+            return np.zeros(0), np.zeros(0)
+        count = int(self._cursor[row])
+        if count <= self.history_size:
+            return self._history_ts[row, :count].copy(), self._history[row, :count].copy()
+        order = np.roll(np.arange(self.history_size), -(count % self.history_size))
+        return self._history_ts[row, order], self._history[row, order]
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(zip(self._symbols, self._latest[:len(self._symbols)].tolist()))
+
+    def stats(self) -> dict:
+        per_symbol = (2 * self.history_size + 2) * 8 + 8
+        return {
+            "symbols": len(self._symbols),
+            "max_symbols": self.max_symbols,
+            "history_size": self.history_size,
+            "ticks": self.ticks,
+            "bytes_per_symbol": per_symbol,
+            "allocated_bytes": int(
+                self._latest.nbytes + self._latest_ts.nbytes + self._history.nbytes
+                + self._history_ts.nbytes + self._cursor.nbytes
+            ),
+        }
+
+
+price_store = PriceStore()
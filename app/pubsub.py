@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional, Set
+from .cache import portfolio_stats_listener
+from .database import SessionLocal
+from .valuation import LATEST_PORTFOLIO_VALUES_SQL, incremental_valuer
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv('SUBSCRIBER_QUEUE_SIZE', '4'))
+
+
+class Subscription:
+    """Bounded per-client queue; when the client falls behind the oldest update is dropped."""
+
+    def __init__(self, portfolio_id: int, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.portfolio_id = portfolio_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, update: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(update)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class PortfolioValueHub:
+    """Fans portfolio value updates out to every subscriber of that portfolio.
+
+    Updates come from the incremental valuer as it flushes and from the shared
+    portfolio_stats LISTEN connection, which triggers one batched re-read of the
+    subscribed portfolios no matter how many clients are connected.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._last: Dict[int, dict] = {}
+        self._refresh: Optional[asyncio.Task] = None
+        self._refresh_pending = False
+
+    def subscribe(self, portfolio_id: int) -> Subscription:
+        subscription = Subscription(portfolio_id)
+        self._subscribers.setdefault(portfolio_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.portfolio_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.portfolio_id]
+            self._last.pop(subscription.portfolio_id, None)
+
+    def latest(self, portfolio_id: int) -> Optional[dict]:
+        return self._last.get(portfolio_id)
+
+    def publish(self, portfolio_id: int, value, as_of: Optional[datetime] = None):
+        subscribers = self._subscribers.get(portfolio_id)
+        if not subscribers:
+            return
+        last = self._last.get(portfolio_id)
+        if last is not None and last["portfolio_value"] == value:
+            return
+        update = {
+            "portfolio_id": portfolio_id,
+            "portfolio_value": value,
+            "as_of": (as_of or datetime.utcnow()).isoformat()
+        }
+        self._last[portfolio_id] = update
+        self.published += 1
+        for subscription in subscribers:
+            subscription.offer(update)
+
+    def on_flush(self, portfolio_ids, values):
+        for portfolio_id, value in zip(portfolio_ids.tolist(), values.tolist()):
+            self.publish(portfolio_id, value)
+
+    def on_notify(self, payload: Optional[str]):
+        # The valuer's own flushes already reached subscribers through on_flush
+        if payload == incremental_valuer.notify_tag:
+            return
+        self.refresh_soon()
+
+    def refresh_soon(self):
+        # Bursts of notifications collapse into one follow-up refresh; one that arrives
+        # mid-refresh still gets its own pass, since that read may predate the change
+        if not self._subscribers:
+            return
+        self._refresh_pending = True
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.ensure_future(self._refresh_while_pending())
+
+    async def _refresh_while_pending(self):
+        while self._refresh_pending:
+            self._refresh_pending = False
+            await self.refresh()
+
+    async def refresh(self, portfolio_ids=None):
+        ids = list(self._subscribers) if portfolio_ids is None else list(portfolio_ids)
+        if not ids:
+            return
+        try:
+            async with SessionLocal() as session:
+                result = await session.execute(LATEST_PORTFOLIO_VALUES_SQL, {"portfolio_ids": ids})
+                rows = result.fetchall()
+        except Exception:
+            logger.exception("Failed to refresh subscribed portfolio values")
+            return
+        for portfolio_id, value, created_at in rows:
+            self.publish(portfolio_id, float(value), created_at)
+
+    def stats(self) -> dict:
+        return {
+            "portfolios": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+        }
+
+
+portfolio_value_hub = PortfolioValueHub()
+incremental_valuer.add_flush_listener(portfolio_value_hub.on_flush)
+portfolio_stats_listener.add_payload_callback(portfolio_value_hub.on_notify)
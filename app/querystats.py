@@ -0,0 +1,159 @@
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged with their parameter shapes and route
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+# Recent durations kept per statement for the p99
+QUERY_STATS_SAMPLES = int(os.getenv('QUERY_STATS_SAMPLES', '1024'))
+# Distinct fingerprints tracked; statements beyond this are counted but not broken out
+QUERY_STATS_MAX_STATEMENTS = int(os.getenv('QUERY_STATS_MAX_STATEMENTS', '500'))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![$\w])\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+)\s*,)+\s*(?:\?|\$\d+)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Collapse literals, IN-lists and whitespace so equivalent statements share one entry."""
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _PLACEHOLDER_LIST.sub("(?, ...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def parameter_shape(parameters: Any, executemany: bool) -> str:
+    """Describe bound parameters by type and size only; values never reach the log."""
+    if executemany:
+        rows = list(parameters or ())
+        return f"{len(rows)} x {parameter_shape(rows[0], False)}" if rows else "0 rows"
+    if isinstance(parameters, dict):
+        items = parameters.values()
+    elif isinstance(parameters, (list, tuple)):
+        items = parameters
+    else:
+        return type(parameters).__name__
+    shapes = []
+    for value in items:
+        if isinstance(value, (list, tuple)):
+            shapes.append(f"{type(value).__name__}[{len(value)}]")
+        else:
+            shapes.append(type(value).__name__)
+    return "(" + ", ".join(shapes) + ")"
+
+
+class StatementStats:
+    __slots__ = ("statement", "count", "total", "max", "_samples", "_next")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: List[float] = []
+        self._next = 0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        # Ring of recent durations so the p99 follows current behaviour
+        if len(self._samples) < QUERY_STATS_SAMPLES:
+            self._samples.append(seconds)
+        else:
+            self._samples[self._next] = seconds
+            self._next = (self._next + 1) % QUERY_STATS_SAMPLES
+
+    def p99(self) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p99_ms": round(self.p99() * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class QueryStats:
+    """In-memory per-fingerprint statement timings, fed from the engine's cursor events."""
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS):
+        self.slow_seconds = slow_ms / 1000
+        self.slow_queries = 0
+        self.untracked = 0
+        self._statements: Dict[str, StatementStats] = {}
+        # Raw SQL text -> entry; repeated statements skip the regex work
+        self._by_text: Dict[str, Optional[StatementStats]] = {}
+
+    def _entry(self, statement: str) -> Optional[StatementStats]:
+        try:
+            return self._by_text[statement]
+        except KeyError:
+            pass
+        key = fingerprint(statement)
+        entry = self._statements.get(key)
+        if entry is None and len(self._statements) < QUERY_STATS_MAX_STATEMENTS:
+            entry = self._statements[key] = StatementStats(key)
+        if len(self._by_text) < QUERY_STATS_MAX_STATEMENTS * 4:
+            self._by_text[statement] = entry
+        return entry
+
+    def record(self, statement: str, parameters: Any, executemany: bool, seconds: float):
+        entry = self._entry(statement)
+        if entry is None:
+            self.untracked += 1
+        else:
+            entry.observe(seconds)
+        if seconds >= self.slow_seconds:
+            self.slow_queries += 1
+            # Request id, route and DB time are added by the logging filter
+            extra = {
+                "duration_ms": round(seconds * 1000, 3),
+                "params": parameter_shape(parameters, executemany),
+                "statement": entry.statement if entry is not None else fingerprint(statement),
+            }
+            if metrics.current_request() is None:
+                extra["route"] = "background"
+            logger.warning("Slow query", extra=extra)
+
+    def top(self, limit: int = 20, order_by: str = "total") -> List[Dict[str, Any]]:
+        keys = {
+            "total": lambda s: s.total,
+            "count": lambda s: s.count,
+            "max": lambda s: s.max,
+            "p99": lambda s: s.p99(),
+        }
+        if order_by not in keys:
+            raise ValueError(f"order_by must be one of {', '.join(keys)}")
+        ordered = sorted(self._statements.values(), key=keys[order_by], reverse=True)
+        return [s.as_dict() for s in ordered[:limit]]
+
+    def reset(self):
+        self._statements.clear()
+        self._by_text.clear()
+        self.slow_queries = 0
+        self.untracked = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slow_query_ms": self.slow_seconds * 1000,
+            "statements": len(self._statements),
+            "slow_queries": self.slow_queries,
+            "untracked": self.untracked,
+        }
+
+
+query_stats = QueryStats()
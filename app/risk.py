@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import text
+from .cache import NotificationListener
+from .database import SessionLocal
+from .models import OrderCreate, PositionCreate
+from .prices import price_store
+from .schema import RISK_LIMITS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in microseconds, of the check latency histogram buckets
+LATENCY_BUCKETS_US = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+class RiskRejected(ValueError):
+    pass
+
+
+class RiskUnavailable(RiskRejected):
+    """Limits and exposures are not loaded, so no order can be checked."""
+
+
+class Limits:
+    __slots__ = ("max_position", "max_order_notional")
+
+    def __init__(self, max_position: Optional[int], max_order_notional: Optional[float]):
+        self.max_position = max_position
+        self.max_order_notional = max_order_notional
+
+
+class RiskEngine:
+    """Pre-trade checks against limits and exposures held in memory.
+
+    Limits and restricted symbols are loaded from the database at startup and reloaded
+    on NOTIFY; exposures (net quantity per user/portfolio and symbol) are loaded from
+    positions and then kept current from position updates, so a check never waits on
+    the database.
+
+    An order that passes reserves its quantity until it fills, is cancelled or its
+    remainder is dropped, and filled quantity counts until its positions are written.
+    Orders that pass one at a time therefore cannot add up past a position limit.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.checks = 0
+        self.rejections = 0
+        self.check_ns_total = 0
+        self.check_ns_max = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_US) + 1)
+        self._user_limits: Dict[int, Limits] = {}
+        self._portfolio_limits: Dict[int, Limits] = {}
+        self._restricted: Set[str] = set()
+        self._user_exposure: Dict[Tuple[int, str], int] = {}
+        self._portfolio_exposure: Dict[Tuple[int, str], int] = {}
+        self._positions: Dict[int, Tuple[int, int, str, int]] = {}
+        # Position changes seen while load() runs, replayed once it has the snapshot
+        self._loading: Optional[List[PositionCreate]] = None
+        # order_id -> (user_id, portfolio_id, symbol, side, unfilled quantity)
+        self._open: Dict[object, List] = {}
+        # (scope, scope_id, symbol, side) -> unfilled quantity of open orders
+        self._reserved: Dict[Tuple[str, int, str, str], int] = {}
+        # (scope, scope_id, symbol) -> net filled quantity not yet written to positions
+        self._unsettled: Dict[Tuple[str, int, str], int] = {}
+        self._reload: Optional[asyncio.Task] = None
+        self._reload_pending = False
+
+    async def load(self):
+        # on_positions buffers until loaded is set; the replay covers changes committed
+        # after the positions snapshot, and ones it already holds apply by value
+        self._loading = []
+        try:
+            async with SessionLocal() as session:
+                await self._load_limits(session)
+                result = await session.execute(text(
+                    "SELECT position_id, user_id, portfolio_id, stock, quantity FROM positions"
+                ))
+                self._user_exposure = {}
+                self._portfolio_exposure = {}
+                self._positions = {}
+                for position_id, user_id, portfolio_id, stock, quantity in result.all():
+                    self._apply(position_id, user_id, portfolio_id, stock, quantity)
+            for p in self._loading:
+                self._apply(p.position_id, p.user_id, p.portfolio_id, p.stock, p.quantity)
+            self.loaded = True
+        finally:
+            self._loading = None
+
+    async def _load_limits(self, session):
+        result = await session.execute(text(
+            "SELECT scope, scope_id, max_position, max_order_notional FROM risk_limits"
+        ))
+        user_limits, portfolio_limits = {}, {}
+        for scope, scope_id, max_position, max_order_notional in result.all():
+            limits = Limits(max_position, float(max_order_notional) if max_order_notional is not None else None)
+            (user_limits if scope == "user" else portfolio_limits)[scope_id] = limits
+        result = await session.execute(text("SELECT symbol FROM restricted_symbols"))
+        # Swap whole maps so a check never sees a half-loaded state
+        self._restricted = {row[0] for row in result.all()}
+        self._user_limits = user_limits
+        self._portfolio_limits = portfolio_limits
+
+    async def reload_limits(self):
+        try:
+            if not self.loaded:
+                # Startup load failed; exposures are needed too
+                await self.load()
+                return
+            async with SessionLocal() as session:
+                await self._load_limits(session)
+        except Exception:
+            logger.exception("Failed to reload risk limits")
+
+    def reload_soon(self):
+        # A notification during a reload may describe a change that reload already missed
+        self._reload_pending = True
+        if self._reload is None or self._reload.done():
+            self._reload = asyncio.ensure_future(self._reload_while_pending())
+
+    async def _reload_while_pending(self):
+        while self._reload_pending:
+            self._reload_pending = False
+            await self.reload_limits()
+
+    def _apply(self, position_id: int, user_id: int, portfolio_id: int, stock: str, quantity: int):
+        previous = self._positions.get(position_id)
+        if previous is not None:
+            _, _, old_stock, old_quantity = previous
+            self._shift(previous[0], previous[1], old_stock, -old_quantity)
+        self._positions[position_id] = (user_id, portfolio_id, stock, quantity)
+        self._shift(user_id, portfolio_id, stock, quantity)
+
+    def _shift(self, user_id: int, portfolio_id: int, stock: str, delta: int):
+        key = (user_id, stock)
+        self._user_exposure[key] = self._user_exposure.get(key, 0) + delta
+        key = (portfolio_id, stock)
+        self._portfolio_exposure[key] = self._portfolio_exposure.get(key, 0) + delta
+
+    def on_positions(self, positions: Iterable[PositionCreate]):
+        if self._loading is not None:
+            self._loading.extend(positions)
+            return
+        if not self.loaded:
+            return
+        for p in positions:
+            self._apply(p.position_id, p.user_id, p.portfolio_id, p.stock, p.quantity)
+
+    def _reserve(self, key: Tuple[str, int, str, str], quantity: int):
+        remaining = self._reserved.get(key, 0) + quantity
+        if remaining:
+            self._reserved[key] = remaining
+        else:
+            self._reserved.pop(key, None)
+
+    def _unsettle(self, key: Tuple[str, int, str], delta: int):
+        remaining = self._unsettled.get(key, 0) + delta
+        if remaining:
+            self._unsettled[key] = remaining
+        else:
+            self._unsettled.pop(key, None)
+
+    def _take(self, order_id, quantity: int) -> Optional[List]:
+        """Remove up to `quantity` from an open order's reservation."""
+        entry = self._open.get(order_id)
+        if entry is None:
+            return None
+        user_id, portfolio_id, symbol, side, unfilled = entry
+        quantity = min(quantity, unfilled)
+        self._reserve(("user", user_id, symbol, side), -quantity)
+        self._reserve(("portfolio", portfolio_id, symbol, side), -quantity)
+        entry[4] -= quantity
+        if entry[4] == 0:
+            del self._open[order_id]
+        return entry
+
+    def on_fill(self, order_id, quantity: int):
+        """Move filled quantity from the order's reservation to unsettled exposure."""
+        entry = self._take(order_id, quantity)
+        if entry is None:
+            return
+        user_id, portfolio_id, symbol, side, _ = entry
+        delta = quantity if side == "buy" else -quantity
+        self._unsettle(("user", user_id, symbol), delta)
+        self._unsettle(("portfolio", portfolio_id, symbol), delta)
+
+    def release(self, order_id):
+        """Drop what is left of an order's reservation: cancelled, expired or never accepted."""
+        entry = self._open.get(order_id)
+        if entry is not None:
+            self._take(order_id, entry[4])
+
+    def settle(self, deltas: Dict[Tuple[int, str], Tuple[int, int]]):
+        """Fill deltas, keyed (portfolio_id, stock) -> (user_id, delta), now written to positions."""
+        for (portfolio_id, stock), (user_id, delta) in deltas.items():
+            self._unsettle(("user", user_id, stock), -delta)
+            self._unsettle(("portfolio", portfolio_id, stock), -delta)
+
+    def _check(self, order: OrderCreate):
+        if order.symbol in self._restricted:
+            raise RiskRejected(f"{order.symbol} is restricted")
+        for limits, exposure, scope, scope_id in (
+            (self._user_limits.get(order.user_id), self._user_exposure.get((order.user_id, order.symbol), 0),
+             "user", order.user_id),
+            (self._portfolio_limits.get(order.portfolio_id),
+             self._portfolio_exposure.get((order.portfolio_id, order.symbol), 0), "portfolio", order.portfolio_id),
+        ):
+            if limits is None:
+                continue
+            if limits.max_position is not None:
+                # Worst case: every open order on this side fills as well
+                exposure += self._unsettled.get((scope, scope_id, order.symbol), 0)
+                pending = self._reserved.get((scope, scope_id, order.symbol, order.side), 0) + order.quantity
+                if abs(exposure + pending if order.side == "buy" else exposure - pending) > limits.max_position:
+                    raise RiskRejected(f"Order would exceed the {scope} position limit of {limits.max_position}")
+            if limits.max_order_notional is not None:
+                price = order.limit_price
+                if price is None:
+                    latest = price_store.latest(order.symbol)
+                    if latest is None:
+                        raise RiskRejected(f"No reference price for {order.symbol}")
+                    price = latest[0]
+                if order.quantity * price > limits.max_order_notional:
+                    raise RiskRejected(f"Order notional exceeds the {scope} limit of {limits.max_order_notional}")
+
+    def check(self, order: OrderCreate, order_id):
+        """Raise RiskRejected if the order breaches a limit, else reserve its quantity.
+
+        Records how long the check took.
+        """
+        if not self.loaded:
+            # Fail closed; an empty limit map would pass every order
+            self.rejections += 1
+            self.reload_soon()
+            raise RiskUnavailable("Risk limits are not loaded")
+        started = time.perf_counter_ns()
+        try:
+            self._check(order)
+        except RiskRejected:
+            self.rejections += 1
+            raise
+        else:
+            self._open[order_id] = [order.user_id, order.portfolio_id, order.symbol, order.side, order.quantity]
+            self._reserve(("user", order.user_id, order.symbol, order.side), order.quantity)
+            self._reserve(("portfolio", order.portfolio_id, order.symbol, order.side), order.quantity)
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            self.checks += 1
+            self.check_ns_total += elapsed
+            self.check_ns_max = max(self.check_ns_max, elapsed)
+            elapsed_us = elapsed / 1000
+            for i, bound in enumerate(LATENCY_BUCKETS_US):
+                if elapsed_us <= bound:
+                    self.latency_buckets[i] += 1
+                    break
+            else:
+                self.latency_buckets[-1] += 1
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "user_limits": len(self._user_limits),
+            "portfolio_limits": len(self._portfolio_limits),
+            "restricted_symbols": len(self._restricted),
+            "open_orders": len(self._open),
+            "checks": self.checks,
+            "rejections": self.rejections,
+            "mean_check_us": self.check_ns_total / self.checks / 1000 if self.checks else 0.0,
+            "max_check_us": self.check_ns_max / 1000,
+            "latency_us": dict(zip([f"le_{b}" for b in LATENCY_BUCKETS_US] + ["le_inf"], self.latency_buckets)),
+        }
+
+
+risk_engine = RiskEngine()
+risk_limits_listener = NotificationListener(RISK_LIMITS_CHANNEL, risk_engine.reload_soon)
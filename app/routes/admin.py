@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Query
+from .. import singleflight
+from ..querystats import query_stats
+from ..pubsub import portfolio_value_hub
+
+router = APIRouter(prefix="/admin")
+
+@router.get("/singleflight")
+async def get_singleflight_stats():
+    return singleflight.stats()
+
+@router.get("/subscriptions")
+async def get_subscription_stats():
+    return portfolio_value_hub.stats()
+
+@router.get("/queries")
+async def get_query_stats(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = "total"
+):
+    try:
+        return {**query_stats.stats(), "top": query_stats.top(limit, order_by)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/queries")
+async def reset_query_stats():
+    query_stats.reset()
+    return {"status": "reset"}
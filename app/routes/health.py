@@ -1,6 +1,12 @@
-from fastapi import APIRouter
+import logging
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy import text
-from ..database import engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import metrics
+from ..database import get_session
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -9,12 +15,15 @@ async def root():
     return {"message": "Service is running"}
 
 @router.get("/health")
-async def health_check():
+async def health_check(session: AsyncSession = Depends(get_session)):
     try:
-        with engine.connect() as connection:
-            connection.execute(text("SELECT 1"))
-            connection.commit()
-            return {"status": "healthy"}
+        await session.execute(text("SELECT 1"))
+        return {"status": "healthy"}
     except Exception as e:
-        print(f"Database health check failed: {str(e)}")
-        return {"status": "unhealthy", "error": str(e)}, 500 
\ No newline at end of file
+        logger.exception("Database health check failed")
+        return JSONResponse(status_code=500, content={"status": "unhealthy", "error": str(e)})
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
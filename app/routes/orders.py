@@ -0,0 +1,63 @@
+import logging
+import uuid
+from fastapi import APIRouter, HTTPException
+from ..models import OrderCreate
+from ..orderbook import order_books
+from ..orders import QueueFull, cancel_order, fill_writer, order_writer, place_order
+from ..risk import RiskRejected, RiskUnavailable, risk_engine
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/orders")
+async def create_order(order: OrderCreate):
+    try:
+        record, fills = await place_order(order)
+    except RiskUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RiskRejected as e:
+        raise HTTPException(status_code=403, detail=f"Risk check failed: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.exception("Failed to create order")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "status": "accepted",
+        "order_id": str(record["order_id"]),
+        "order_status": record["status"],
+        "filled_quantity": record["filled_quantity"],
+        # What a market order could not fill; market orders never rest
+        "dropped_quantity": record["quantity"] - record["filled_quantity"] if record["order_type"] == "market" else 0,
+        "fills": [fill.as_dict() for fill in fills]
+    }
+
+@router.delete("/orders/{order_id}")
+async def delete_order(order_id: uuid.UUID):
+    try:
+        cancelled = await cancel_order(order_id)
+    except Exception as e:
+        logger.exception("Failed to cancel order")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="No resting order found")
+    return {"status": "cancelled", "order_id": str(order_id)}
+
+@router.get("/orderbook/{symbol}")
+async def get_order_book(symbol: str, levels: int = 10):
+    book = order_books.get(symbol)
+    if book is None:
+        return {"symbol": symbol, "bids": [], "asks": []}
+    return book.depth(levels)
+
+@router.get("/orders/writer")
+async def get_order_writer_stats():
+    return {**order_writer.stats(), **fill_writer.stats(), **order_books.stats()}
+
+@router.get("/risk")
+async def get_risk_stats():
+    return risk_engine.stats()
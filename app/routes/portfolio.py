@@ -1,20 +1,141 @@
-from fastapi import APIRouter, HTTPException
+import logging
+from typing import List
+from fastapi import APIRouter, HTTPException, Path, Query, Request, Response
 from sqlalchemy import text
-from ..database import engine
+from ..cache import MISSING, portfolio_stats_listener, portfolio_value_cache
+from ..database import SessionLocal
+from ..etag import etag_headers, etag_matches, make_etag, not_modified
+from ..models import INT4_MAX, INT4_MIN, Int4
+from ..singleflight import coalesce
+from ..valuation import LATEST_PORTFOLIO_VALUES_SQL
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# max(id) is the version marker for the ETag: any new stats row changes it
+LATEST_PORTFOLIO_VALUE_WITH_VERSION_SQL = text("""
+    SELECT (SELECT max(id) FROM portfolio_stats), portfolio_value
+    FROM portfolio_stats ORDER BY created_at DESC LIMIT 1
+""")
+
+@coalesce()
+async def latest_portfolio_value() -> tuple:
+    """(etag, value) for the newest portfolio value, from the cache when it is fresh."""
+    cached = portfolio_value_cache.get()
+    if cached is not MISSING:
+        return cached
+
+    generation = portfolio_value_cache.generation()
+    # Only a cache miss opens a session, so hits never touch the pool
+    async with SessionLocal() as session:
+        result = await session.execute(LATEST_PORTFOLIO_VALUE_WITH_VERSION_SQL)
+        row = result.fetchone()
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="No portfolio value found")
+
+    entry = (make_etag("portfolio-value", row[0]), row[1])
+    portfolio_value_cache.set(entry, generation)
+    return entry
+
 @router.get("/portfolio-value")
-async def get_portfolio_value():
+async def get_portfolio_value(request: Request, response: Response):
     try:
-        with engine.connect() as connection:
-            result = connection.execute(text("SELECT portfolio_value FROM portfolio_stats ORDER BY created_at DESC LIMIT 1"))
+        etag, value = await latest_portfolio_value()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Failed to fetch portfolio value")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    return {"portfolio_value": value}
+
+@router.get("/portfolio-value/cache")
+async def get_portfolio_value_cache_stats():
+    return {**portfolio_value_cache.stats(), "listening": portfolio_stats_listener.connected}
+
+MAX_BATCH_PORTFOLIOS = 1000
+
+LATEST_PORTFOLIO_VALUE_SQL = text("""
+    SELECT portfolio_value, created_at FROM portfolio_stats
+    WHERE portfolio_id = :portfolio_id
+    ORDER BY created_at DESC LIMIT 1
+""")
+
+USER_PORTFOLIO_VALUES_SQL = text("""
+    SELECT owned.portfolio_id, latest.portfolio_value, latest.created_at
+    FROM (SELECT DISTINCT portfolio_id FROM positions WHERE user_id = :user_id) owned
+    CROSS JOIN LATERAL (
+        SELECT portfolio_value, created_at FROM portfolio_stats s
+        WHERE s.portfolio_id = owned.portfolio_id
+        ORDER BY s.created_at DESC LIMIT 1
+    ) latest
+    ORDER BY owned.portfolio_id
+""")
+
+def portfolio_value_row(row) -> dict:
+    return {
+        "portfolio_id": row[0],
+        "portfolio_value": row[1],
+        "as_of": row[2].isoformat() if row[2] else None
+    }
+
+@router.get("/portfolios/values")
+async def get_portfolio_values(portfolio_id: List[Int4] = Query(...)):
+    if len(portfolio_id) > MAX_BATCH_PORTFOLIOS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_PORTFOLIOS} portfolio ids per request")
+    try:
+        async with SessionLocal() as session:
+            result = await session.execute(LATEST_PORTFOLIO_VALUES_SQL, {"portfolio_ids": list(set(portfolio_id))})
+            rows = result.fetchall()
+        found = {row[0] for row in rows}
+        return {
+            "portfolios": [portfolio_value_row(row) for row in rows],
+            "missing": [pid for pid in portfolio_id if pid not in found]
+        }
+    except Exception as e:
+        logger.exception("Failed to fetch portfolio values")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/portfolios/{portfolio_id}/value")
+@coalesce()
+async def get_portfolio_value_by_id(portfolio_id: int = Path(ge=INT4_MIN, le=INT4_MAX)):
+    try:
+        async with SessionLocal() as session:
+            result = await session.execute(LATEST_PORTFOLIO_VALUE_SQL, {"portfolio_id": portfolio_id})
             row = result.fetchone()
-            
-            if row is None:
-                raise HTTPException(status_code=404, detail="No portfolio value found")
-                
-            return {"portfolio_value": row[0]}
+
+        if row is None:
+            raise HTTPException(status_code=404, detail="No portfolio value found")
+
+        return portfolio_value_row((portfolio_id,) + tuple(row))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Failed to fetch portfolio value")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/users/{user_id}/portfolio-value")
+async def get_user_portfolio_value(user_id: int = Path(ge=INT4_MIN, le=INT4_MAX)):
+    try:
+        async with SessionLocal() as session:
+            result = await session.execute(USER_PORTFOLIO_VALUES_SQL, {"user_id": user_id})
+            rows = result.fetchall()
+
+        if not rows:
+            raise HTTPException(status_code=404, detail="No portfolio value found")
+
+        return {
+            "user_id": user_id,
+            "portfolio_value": sum(row[1] for row in rows),
+            "portfolios": [portfolio_value_row(row) for row in rows]
+        }
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Failed to fetch portfolio value: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.exception("Failed to fetch portfolio value")
+        raise HTTPException(status_code=500, detail=str(e))
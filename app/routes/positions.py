@@ -0,0 +1,41 @@
+import logging
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import PositionCreate
+from ..database import get_session
+from ..positions import upsert_positions
+from ..risk import risk_engine
+from ..valuation import incremental_valuer
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+MAX_BATCH_POSITIONS = 50000
+
+@router.post("/positions")
+async def create_position(position: PositionCreate, session: AsyncSession = Depends(get_session)):
+    try:
+        await upsert_positions(session, [position])
+        await session.commit()
+        incremental_valuer.on_positions([position])
+        risk_engine.on_positions([position])
+        return {"status": "success", "message": "Position saved successfully"}
+    except Exception as e:
+        logger.exception("Failed to save position")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/positions/batch")
+async def create_positions(positions: List[PositionCreate], session: AsyncSession = Depends(get_session)):
+    if len(positions) > MAX_BATCH_POSITIONS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_POSITIONS} positions per request")
+    try:
+        count = await upsert_positions(session, positions)
+        await session.commit()
+        incremental_valuer.on_positions(positions)
+        risk_engine.on_positions(positions)
+        return {"status": "success", "upserted": count}
+    except Exception as e:
+        logger.exception("Failed to save positions")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,79 @@
+import logging
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import ValidationError
+from ..cache import portfolio_value_cache
+from ..database import SessionLocal
+from ..models import PriceTick
+from ..ndjson import iter_ndjson
+from ..prices import PriceStoreFull, price_store
+from ..valuation import incremental_valuer
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+async def ingest(ticks: List[PriceTick]):
+    latest: Dict[str, float] = {}
+    full: Optional[PriceStoreFull] = None
+    try:
+        for tick in ticks:
+            price_store.update(tick.symbol, tick.price, tick.timestamp.timestamp() if tick.timestamp else None)
+            latest[tick.symbol] = tick.price
+    except PriceStoreFull as e:
+        # Ticks before this one are already in the store; the valuer still gets them below
+        full = e
+
+    # Keep valuations fresh; the valuer loads at startup, or here if that failed
+    if latest:
+        try:
+            async with SessionLocal() as session:
+                await incremental_valuer.ensure_loaded(session)
+                incremental_valuer.on_prices(latest)
+                if await incremental_valuer.flush(session):
+                    portfolio_value_cache.invalidate()
+        except Exception:
+            logger.exception("Failed to flush portfolio values")
+
+    if full is not None:
+        raise HTTPException(status_code=507, detail=str(full))
+
+@router.post("/prices")
+async def post_prices(ticks: List[PriceTick]):
+    await ingest(ticks)
+    return {"status": "success", "ingested": len(ticks)}
+
+@router.post("/prices/stream")
+async def stream_prices(request: Request):
+    ingested = 0
+    try:
+        async for items in iter_ndjson(request):
+            ticks = [PriceTick(**item) for item in items]
+            await ingest(ticks)
+            ingested += len(ticks)
+    except (ValueError, TypeError, ValidationError) as e:
+        # Ticks before the bad line have already been applied
+        raise HTTPException(status_code=400, detail=f"Malformed tick after {ingested} ingested: {str(e)}")
+    return {"status": "success", "ingested": ingested}
+
+@router.get("/prices")
+async def get_prices(symbol: List[str] = Query(...)):
+    prices = price_store.gather(symbol)
+    return {
+        "prices": {s: (None if p != p else p) for s, p in zip(symbol, prices.tolist())}
+    }
+
+@router.get("/prices/stats")
+async def get_price_store_stats():
+    return price_store.stats()
+
+@router.get("/prices/{symbol}")
+async def get_price(symbol: str, history: bool = False):
+    latest = price_store.latest(symbol)
+    if latest is None:
+        raise HTTPException(status_code=404, detail="No price for symbol")
+    response = {"symbol": symbol, "price": latest[0], "timestamp": latest[1]}
+    if history:
+        timestamps, prices = price_store.history(symbol)
+        response["history"] = [{"timestamp": t, "price": p} for t, p in zip(timestamps.tolist(), prices.tolist())]
+    return response
@@ -0,0 +1,35 @@
+import uuid
+from fastapi import APIRouter, HTTPException
+from ..models import ParentOrderCreate
+from ..scheduler import execution_scheduler
+
+router = APIRouter()
+
+@router.post("/parent-orders")
+async def create_parent_order(request: ParentOrderCreate):
+    if request.slices > request.quantity:
+        raise HTTPException(status_code=400, detail="More slices than shares to trade")
+    if request.volume_curve is not None and (
+        not request.volume_curve or min(request.volume_curve) < 0 or sum(request.volume_curve) <= 0
+    ):
+        raise HTTPException(status_code=400, detail="volume_curve must be non-negative with a positive sum")
+    parent = execution_scheduler.submit(request)
+    return {"status": "accepted", **parent.as_dict(), "slice_quantities": parent.quantities.tolist()}
+
+@router.get("/parent-orders/{parent_id}")
+async def get_parent_order(parent_id: uuid.UUID):
+    parent = execution_scheduler.get(parent_id)
+    if parent is None:
+        raise HTTPException(status_code=404, detail="Parent order not found")
+    return parent.as_dict()
+
+@router.delete("/parent-orders/{parent_id}")
+async def cancel_parent_order(parent_id: uuid.UUID):
+    parent = execution_scheduler.cancel(parent_id)
+    if parent is None:
+        raise HTTPException(status_code=404, detail="Parent order not found")
+    return parent.as_dict()
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    return execution_scheduler.stats()
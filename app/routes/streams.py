@@ -0,0 +1,62 @@
+import asyncio
+import json
+from fastapi import APIRouter, Path, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from ..models import INT4_MAX, INT4_MIN
+from ..pubsub import Subscription, portfolio_value_hub
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = 15
+
+async def open_subscription(portfolio_id: int) -> Subscription:
+    subscription = portfolio_value_hub.subscribe(portfolio_id)
+    latest = portfolio_value_hub.latest(portfolio_id)
+    if latest is not None:
+        subscription.offer(latest)
+    else:
+        # First subscriber for this portfolio; the read publishes to everyone waiting on it
+        await portfolio_value_hub.refresh([portfolio_id])
+    return subscription
+
+async def sse_events(subscription: Subscription):
+    try:
+        while True:
+            try:
+                update = await asyncio.wait_for(subscription.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: portfolio_value\ndata: {json.dumps(update)}\n\n"
+    finally:
+        portfolio_value_hub.unsubscribe(subscription)
+
+@router.get("/portfolios/{portfolio_id}/stream")
+async def stream_portfolio_value(portfolio_id: int = Path(ge=INT4_MIN, le=INT4_MAX)):
+    subscription = await open_subscription(portfolio_id)
+    return StreamingResponse(
+        sse_events(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/portfolios/{portfolio_id}/ws")
+async def websocket_portfolio_value(websocket: WebSocket, portfolio_id: int = Path(ge=INT4_MIN, le=INT4_MAX)):
+    await websocket.accept()
+    subscription = await open_subscription(portfolio_id)
+
+    async def send_updates():
+        while True:
+            await websocket.send_json(await subscription.get())
+
+    sender = asyncio.ensure_future(send_updates())
+    try:
+        # Clients only listen; receiving is how we notice they went away
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        portfolio_value_hub.unsubscribe(subscription)
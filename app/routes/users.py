@@ -1,67 +1,313 @@
-from fastapi import APIRouter, HTTPException
-from sqlalchemy import text
+import csv
+import io
+import json
+import logging
+import orjson
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import DateTime, Integer, String, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from ..models import UserCreate
-from ..database import engine
+from pydantic import ValidationError
+from ..models import INT4_MAX, INT4_MIN, UserCreate
+from ..compression import cached_response
+from ..database import SessionLocal, get_session
+from ..etag import CACHE_CONTROL, etag_headers, etag_matches, make_etag, not_modified
+from ..ndjson import is_ndjson, iter_ndjson
+from ..singleflight import coalesce
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Public field name -> users column. user_id is always selected since it is the cursor.
+USER_FIELDS = {
+    "id": "user_id",
+    "email": "email",
+    "name": "name",
+    "created_at": "created_at",
+}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(USER_FIELDS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in USER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+# Every committed write to users bumps its table_versions row (see schema.py), including a
+# bulk insert that commits after later single inserts and so moves neither max(user_id)
+# nor max(created_at). The max() columns, each one probe at the end of an index, still
+# move for new users should the counter trigger be missing.
+USERS_WATERMARK_SQL = text("""
+    SELECT (SELECT version FROM table_versions WHERE name = 'users'), max(user_id), max(created_at)
+    FROM users
+""")
+
+@coalesce()
+async def users_watermark() -> tuple:
+    async with SessionLocal() as session:
+        result = await session.execute(USERS_WATERMARK_SQL)
+        return tuple(result.fetchone())
+
+# The watermark is part of the coalescing key, so a caller never joins a read that
+# started before the version its ETag describes
+@coalesce()
+async def users_page(limit: int, after_user_id: Optional[int], selected: tuple, watermark: tuple) -> bytes:
+    # Columns come back in response order; user_id is appended when not requested since it is the cursor
+    columns = [USER_FIELDS[f] for f in selected]
+    if "id" not in selected:
+        columns.append("user_id")
+    cursor_index = columns.index("user_id")
+    params = {"limit": limit + 1}
+    where = ""
+    if after_user_id is not None:
+        where = "WHERE user_id > :after_user_id "
+        params["after_user_id"] = after_user_id
+    # Walk the primary key index; fetch one extra row to know whether another page exists
+    async with SessionLocal() as session:
+        result = await session.execute(
+            text(f"SELECT {', '.join(columns)} FROM users {where}ORDER BY user_id LIMIT :limit"),
+            params
+        )
+        rows = result.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    # Rows are already JSON-native (orjson writes datetimes itself), so skip jsonable_encoder
+    return orjson.dumps({
+        "users": [dict(zip(selected, row)) for row in rows],
+        "next_cursor": rows[-1][cursor_index] if has_more else None
+    })
+
 @router.get("/users")
-async def get_users():
+async def get_users(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after_user_id: Optional[int] = Query(None, ge=INT4_MIN, le=INT4_MAX),
+    fields: Optional[str] = None
+):
+    selected = tuple(parse_fields(fields))
     try:
-        with engine.connect() as connection:
-            result = connection.execute(text("SELECT * FROM users"))
-            rows = result.fetchall()
-            
-            users = [
-                {
-                    "id": row[0],
-                    "email": row[1],
-                    "name": row[2],
-                    "created_at": row[3].isoformat() if row[3] else None
-                }
-                for row in rows
-            ]
-            return {"users": users}
+        # The watermark is read before the page, so the page is never older than its ETag
+        watermark = await users_watermark()
+        etag = make_etag("users", watermark, limit, after_user_id, selected)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        # A repeat of a page this process already compressed skips the query and both encodings
+        cached = cached_response(request, etag, headers={"Cache-Control": CACHE_CONTROL})
+        if cached is not None:
+            return cached
+        body = await users_page(limit, after_user_id, selected, watermark)
     except Exception as e:
-        print(f"Failed to fetch users: {str(e)}")
-        return {"status": "error", "error": str(e)}, 500
+        logger.exception("Failed to fetch users")
+        return JSONResponse(status_code=500, content={"status": "error", "error": str(e)})
 
-@router.post("/users")
-async def create_user(user: UserCreate):
+    return Response(content=body, media_type="application/json", headers=etag_headers(etag))
+
+EXPORT_CHUNK_ROWS = 5000
+
+def format_ndjson(rows) -> bytes:
+    return b"".join(
+        orjson.dumps({
+            "id": row[0],
+            "email": row[1],
+            "name": row[2],
+            "created_at": row[3]
+        }) + b"\n"
+        for row in rows
+    )
+
+def format_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        (row[0], row[1], row[2], row[3].isoformat() if row[3] else "")
+        for row in rows
+    )
+    return buffer.getvalue()
+
+async def export_users(formatter, header: str = ""):
+    if header:
+        yield header
     try:
-        with engine.connect() as connection:
-            # Check if user_id already exists
-            result = connection.execute(
-                text("SELECT 1 FROM users WHERE user_id = :user_id"),
-                {"user_id": user.user_id}
+        # The session is owned by the generator so it outlives the handler; stream()
+        # uses a server-side cursor. The size is passed to partitions() explicitly: a
+        # text() statement run through the session ignores yield_per, and partitions()
+        # without a size hands back the whole result as one chunk.
+        async with SessionLocal() as session:
+            result = await session.stream(
+                text("SELECT user_id, email, name, created_at FROM users ORDER BY user_id").execution_options(
+                    yield_per=EXPORT_CHUNK_ROWS
+                )
             )
-            if result.fetchone():
+            async for rows in result.partitions(EXPORT_CHUNK_ROWS):
+                yield formatter(rows)
+    except Exception:
+        # Headers are already sent, so the client sees a truncated body
+        logger.exception("Failed to export users")
+        raise
+
+@router.get("/users/export")
+async def export_users_endpoint(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    if format == "csv":
+        return StreamingResponse(
+            export_users(format_csv, header="id,email,name,created_at\r\n"),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=users.csv"}
+        )
+    return StreamingResponse(export_users(format_ndjson), media_type="application/x-ndjson")
+
+# One statement does the insert and reports why it did not happen. The outer SELECT reads
+# the snapshot from before the insert, so the EXISTS checks only see pre-existing rows.
+# Concurrent duplicates are stopped by ON CONFLICT against the primary key and the
+# users_email_key unique index (see schema.py); the NOT EXISTS guard alone cannot.
+CREATE_USER_SQL = text("""
+    WITH inserted AS (
+        INSERT INTO users (user_id, email, name, last_login)
+        SELECT :user_id, :email, :name, :last_login
+        WHERE NOT EXISTS (SELECT 1 FROM users WHERE email = :email)
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+    )
+    SELECT
+        EXISTS (SELECT 1 FROM inserted) AS created,
+        EXISTS (SELECT 1 FROM users WHERE user_id = :user_id) AS user_id_taken,
+        EXISTS (SELECT 1 FROM users WHERE email = :email) AS email_taken
+""").bindparams(
+    # Typed so the driver casts them; INSERT ... SELECT gives postgres no column context
+    bindparam("user_id", type_=Integer),
+    bindparam("email", type_=String),
+    bindparam("name", type_=String),
+    bindparam("last_login", type_=DateTime)
+)
+
+@router.post("/users")
+async def create_user(user: UserCreate, session: AsyncSession = Depends(get_session)):
+    try:
+        result = await session.execute(
+            CREATE_USER_SQL,
+            {
+                "user_id": user.user_id,
+                "email": user.email,
+                "name": user.name,
+                "last_login": datetime.utcnow()
+            }
+        )
+        created, user_id_taken, email_taken = result.one()
+        if not created:
+            await session.rollback()
+            if user_id_taken:
                 raise HTTPException(status_code=400, detail="User ID already exists")
-            
-            # Check if email already exists
-            result = connection.execute(
-                text("SELECT 1 FROM users WHERE email = :email"),
-                {"email": user.email}
-            )
-            if result.fetchone():
+            if email_taken:
                 raise HTTPException(status_code=400, detail="Email already exists")
-            
-            # Insert new user
-            connection.execute(
-                text("INSERT INTO users (user_id, email, name, last_login) VALUES (:user_id, :email, :name, :last_login)"),
-                {
-                    "user_id": user.user_id,
-                    "email": user.email,
-                    "name": user.name,
-                    "last_login": datetime.utcnow()
-                }
-            )
-            connection.commit()
-            
-            return {"status": "success", "message": "User created successfully"}
+            # Lost a race with a concurrent insert that committed after our snapshot
+            raise HTTPException(status_code=400, detail="User already exists")
+        await session.commit()
+
+        return {"status": "success", "message": "User created successfully"}
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"Failed to create user: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.exception("Failed to create user")
+        raise HTTPException(status_code=500, detail=str(e))
+
+MAX_BULK_USERS = 100000
+
+# Staged rows are checked against the table and against each other, valid rows are inserted
+# in one pass, and every row that did not make it in comes back with a reason.
+MERGE_STAGED_USERS_SQL = text("""
+    WITH classified AS (
+        SELECT s.row_no, s.user_id, s.email, s.name,
+            CASE
+                WHEN EXISTS (SELECT 1 FROM users u WHERE u.user_id = s.user_id) THEN 'User ID already exists'
+                WHEN EXISTS (SELECT 1 FROM users u WHERE u.email = s.email) THEN 'Email already exists'
+                WHEN row_number() OVER (PARTITION BY s.user_id ORDER BY s.row_no) > 1 THEN 'Duplicate user ID in batch'
+                WHEN row_number() OVER (PARTITION BY s.email ORDER BY s.row_no) > 1 THEN 'Duplicate email in batch'
+            END AS error
+        FROM users_staging s
+    ),
+    inserted AS (
+        INSERT INTO users (user_id, email, name, last_login)
+        SELECT user_id, email, name, :last_login FROM classified WHERE error IS NULL
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+    )
+    SELECT c.row_no, COALESCE(c.error, 'User already exists')
+    FROM classified c
+    WHERE c.error IS NOT NULL OR NOT EXISTS (SELECT 1 FROM inserted i WHERE i.user_id = c.user_id)
+    ORDER BY c.row_no
+""").bindparams(bindparam("last_login", type_=DateTime))
+
+async def read_bulk_payload(request: Request) -> list:
+    try:
+        if is_ndjson(request):
+            items = []
+            async for batch in iter_ndjson(request):
+                items.extend(batch)
+                if len(items) > MAX_BULK_USERS:
+                    break
+        else:
+            items = json.loads(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed payload: {str(e)}")
+
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON stream of users")
+    if len(items) > MAX_BULK_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_USERS} users per request")
+    return items
+
+def validate_bulk_users(items: list) -> tuple:
+    records = []
+    failed = []
+    for row_no, item in enumerate(items):
+        try:
+            user = UserCreate.model_validate(item)
+        except ValidationError as e:
+            failed.append({"row": row_no, "error": str(e)})
+            continue
+        records.append((row_no, user.user_id, user.email, user.name))
+    return records, failed
+
+@router.post("/users/bulk")
+async def create_users_bulk(request: Request, session: AsyncSession = Depends(get_session)):
+    items = await read_bulk_payload(request)
+    # 100k rows take a while to validate; keep the event loop serving other requests
+    records, failed = await run_in_threadpool(validate_bulk_users, items)
+
+    conflicts = []
+    try:
+        if records:
+            await session.execute(text(
+                "CREATE TEMP TABLE users_staging "
+                "(row_no integer, user_id integer, email text, name text) ON COMMIT DROP"
+            ))
+            connection = await session.connection()
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                "users_staging",
+                records=records,
+                columns=["row_no", "user_id", "email", "name"]
+            )
+            result = await session.execute(MERGE_STAGED_USERS_SQL, {"last_login": datetime.utcnow()})
+            conflicts = result.fetchall()
+            await session.commit()
+            failed.extend({"row": row[0], "error": row[1]} for row in conflicts)
+            failed.sort(key=lambda f: f["row"])
+    except Exception as e:
+        logger.exception("Failed to bulk create users")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "status": "success",
+        "created": len(records) - len(conflicts),
+        "failed": failed
+    }
@@ -0,0 +1,36 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..cache import portfolio_value_cache
+from ..database import get_session
+from ..models import ValuationRequest
+from ..prices import price_store
+from ..valuation import incremental_valuer, revalue_all
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/valuations")
+async def run_valuation(request: ValuationRequest, session: AsyncSession = Depends(get_session)):
+    try:
+        prices = request.prices if request.prices is not None else price_store.as_dict()
+        result = await revalue_all(session, prices)
+    except Exception as e:
+        logger.exception("Failed to revalue portfolios")
+        raise HTTPException(status_code=500, detail=str(e))
+    portfolio_value_cache.invalidate()
+    return {"status": "success", **result}
+
+@router.post("/valuations/ticks")
+async def apply_price_ticks(request: ValuationRequest, session: AsyncSession = Depends(get_session)):
+    try:
+        await incremental_valuer.ensure_loaded(session)
+        incremental_valuer.on_prices(request.prices or {})
+        written = await incremental_valuer.flush(session)
+    except Exception as e:
+        logger.exception("Failed to apply price ticks")
+        raise HTTPException(status_code=500, detail=str(e))
+    if written:
+        portfolio_value_cache.invalidate()
+    return {"status": "success", "updated": written}
@@ -0,0 +1,208 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+import numpy as np
+from .models import OrderCreate, ParentOrderCreate
+from .orders import place_order
+
+logger = logging.getLogger(__name__)
+
+# Finished parent orders kept around for status queries
+MAX_FINISHED_PARENTS = 10000
+
+# Relative traded volume over a trading day in 13 half-hour buckets: heavy at the open and close
+DEFAULT_VOLUME_CURVE = np.array([12.0, 9.0, 7.5, 6.5, 6.0, 5.5, 5.5, 5.5, 6.0, 6.5, 7.5, 9.0, 13.0])
+
+
+def slice_quantities(quantity: int, weights: np.ndarray) -> np.ndarray:
+    """Split an integer quantity in proportion to weights; slices sum exactly to quantity."""
+    cumulative = np.cumsum(weights, dtype=np.float64)
+    # Round the running total rather than each slice so rounding error never accumulates
+    targets = np.floor(quantity * cumulative / cumulative[-1] + 0.5).astype(np.int64)
+    targets[-1] = quantity
+    return np.diff(targets, prepend=0)
+
+
+def volume_weights(slices: int, curve: Optional[Sequence[float]] = None) -> np.ndarray:
+    """Resample a volume curve onto `slices` equal time buckets."""
+    curve = DEFAULT_VOLUME_CURVE if curve is None else np.asarray(curve, dtype=np.float64)
+    # Integrate the step curve, then difference it at the slice boundaries
+    edges = np.linspace(0, len(curve), slices + 1)
+    cumulative = np.concatenate([[0.0], np.cumsum(curve)])
+    return np.diff(np.interp(edges, np.arange(len(curve) + 1), cumulative))
+
+
+class ParentOrder:
+    __slots__ = ("parent_id", "request", "quantities", "due_times", "next_slice", "emitted", "failed", "cancelled")
+
+    def __init__(self, parent_id: uuid.UUID, request: ParentOrderCreate, start: float):
+        self.parent_id = parent_id
+        self.request = request
+        if request.strategy == "vwap":
+            weights = volume_weights(request.slices, request.volume_curve)
+        else:
+            weights = np.ones(request.slices)
+        self.quantities = slice_quantities(request.quantity, weights)
+        interval = request.duration_seconds / request.slices
+        self.due_times = start + interval * np.arange(request.slices)
+        self.next_slice = 0
+        self.emitted = 0
+        self.failed = 0
+        self.cancelled = False
+
+    @property
+    def done(self) -> bool:
+        return self.cancelled or self.next_slice >= len(self.quantities)
+
+    def child(self, quantity: int) -> OrderCreate:
+        r = self.request
+        return OrderCreate(
+            user_id=r.user_id,
+            portfolio_id=r.portfolio_id,
+            symbol=r.symbol,
+            side=r.side,
+            quantity=quantity,
+            order_type="limit" if r.limit_price is not None else "market",
+            limit_price=r.limit_price
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "parent_id": str(self.parent_id),
+            "symbol": self.request.symbol,
+            "side": self.request.side,
+            "strategy": self.request.strategy,
+            "quantity": self.request.quantity,
+            "slices": len(self.quantities),
+            "next_slice": self.next_slice,
+            "emitted_quantity": self.emitted,
+            "failed_quantity": self.failed,
+            "status": "cancelled" if self.cancelled else ("done" if self.done else "working")
+        }
+
+
+class ExecutionScheduler:
+    """Drives every parent order from one task using a heap of (due time, parent) entries.
+
+    Each parent has at most one entry in the heap, for its next slice, so a tick costs
+    O(log n) per due slice and nothing for parents that are not yet due.
+    """
+
+    def __init__(self, emit: Callable[[OrderCreate], Awaitable[object]]):
+        self.emit = emit
+        self.ticks = 0
+        self.tick_seconds_total = 0.0
+        self.tick_seconds_max = 0.0
+        self._parents: Dict[uuid.UUID, ParentOrder] = {}
+        self._heap: List = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending = set()
+        self._finished = deque()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def submit(self, request: ParentOrderCreate) -> ParentOrder:
+        parent = ParentOrder(uuid.uuid4(), request, time.monotonic())
+        self._parents[parent.parent_id] = parent
+        self._schedule(parent)
+        return parent
+
+    def get(self, parent_id: uuid.UUID) -> Optional[ParentOrder]:
+        return self._parents.get(parent_id)
+
+    def cancel(self, parent_id: uuid.UUID) -> Optional[ParentOrder]:
+        parent = self._parents.get(parent_id)
+        if parent is not None and not parent.done:
+            # Its heap entry is dropped when it comes due
+            parent.cancelled = True
+            self._finish(parent)
+        return parent
+
+    def _finish(self, parent: ParentOrder):
+        self._finished.append(parent.parent_id)
+        while len(self._finished) > MAX_FINISHED_PARENTS:
+            self._parents.pop(self._finished.popleft(), None)
+
+    def _schedule(self, parent: ParentOrder):
+        due = float(parent.due_times[parent.next_slice])
+        is_earliest = not self._heap or due < self._heap[0][0]
+        heapq.heappush(self._heap, (due, next(self._seq), parent))
+        if is_earliest and self._wakeup is not None:
+            self._wakeup.set()
+
+    def tick(self, now: float) -> int:
+        """Emit every slice due at `now`; returns the number of child orders started."""
+        started = time.perf_counter()
+        emitted = 0
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, parent = heapq.heappop(heap)
+            if parent.cancelled:
+                continue
+            quantity = int(parent.quantities[parent.next_slice])
+            parent.next_slice += 1
+            if quantity > 0:
+                task = asyncio.ensure_future(self._emit(parent, quantity))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+                emitted += 1
+            if parent.done:
+                self._finish(parent)
+            else:
+                self._schedule(parent)
+        elapsed = time.perf_counter() - started
+        self.ticks += 1
+        self.tick_seconds_total += elapsed
+        self.tick_seconds_max = max(self.tick_seconds_max, elapsed)
+        return emitted
+
+    async def _emit(self, parent: ParentOrder, quantity: int):
+        try:
+            await self.emit(parent.child(quantity))
+            parent.emitted += quantity
+        except Exception:
+            parent.failed += quantity
+            logger.exception("Failed to emit child order for %s", parent.parent_id)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            timeout = None
+            if self._heap:
+                timeout = max(0.0, self._heap[0][0] - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.tick(time.monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "active_parents": len(self._parents) - len(self._finished),
+            "scheduled_slices": len(self._heap),
+            "in_flight_children": len(self._pending),
+            "ticks": self.ticks,
+            "mean_tick_us": self.tick_seconds_total / self.ticks * 1e6 if self.ticks else 0.0,
+            "max_tick_us": self.tick_seconds_max * 1e6,
+        }
+
+
+execution_scheduler = ExecutionScheduler(emit=place_order)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from .database import engine
+from .models import FILL_POSITION_ID_MIN
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_STATS_CHANNEL = "portfolio_stats_changed"
+RISK_LIMITS_CHANNEL = "risk_limits_changed"
+
+
+def _create_trigger_if_missing(name: str, table: str, function: str) -> str:
+    """Statement-level change trigger, created only when absent.
+
+    Dropping and recreating on every startup would take a lock on the table each time
+    and leave a window without the trigger. duplicate_object covers another instance
+    creating it concurrently.
+    """
+    return f"""
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_trigger WHERE tgname = '{name}' AND tgrelid = '{table}'::regclass
+        ) THEN
+            CREATE TRIGGER {name}
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+        END IF;
+    EXCEPTION WHEN duplicate_object THEN
+        NULL;
+    END
+    $$
+    """
+
+
+# Idempotent DDL the service relies on, applied at startup. Each entry is run on its own
+# because asyncpg does not accept several commands in one prepared statement.
+SCHEMA_STATEMENTS = [
+    # Ids for positions opened by fills, from a range client position_ids are kept out of
+    # (PositionCreate). Created once, starting above any id already in that range.
+    f"""
+    DO $$
+    BEGIN
+        IF to_regclass('positions_fill_id_seq') IS NULL THEN
+            CREATE SEQUENCE positions_fill_id_seq MINVALUE {FILL_POSITION_ID_MIN} MAXVALUE 2147483647;
+            PERFORM setval('positions_fill_id_seq',
+                GREATEST({FILL_POSITION_ID_MIN}, COALESCE((SELECT max(position_id) FROM positions), 0) + 1), false);
+        END IF;
+    END
+    $$
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id uuid PRIMARY KEY,
+        user_id integer NOT NULL,
+        portfolio_id integer NOT NULL,
+        symbol text NOT NULL,
+        side text NOT NULL,
+        quantity integer NOT NULL,
+        order_type text NOT NULL,
+        limit_price numeric,
+        status text NOT NULL DEFAULT 'accepted',
+        filled_quantity integer NOT NULL DEFAULT 0,
+        created_at timestamp NOT NULL DEFAULT now()
+    )
+    """,
+    # Tables created before fills were tracked
+    "ALTER TABLE orders ADD COLUMN IF NOT EXISTS filled_quantity integer NOT NULL DEFAULT 0",
+    f"""
+    CREATE OR REPLACE FUNCTION notify_portfolio_stats_changed() RETURNS trigger AS $$
+    BEGIN
+        -- The writer may tag its transaction so its own listeners can skip the echo
+        PERFORM pg_notify('{PORTFOLIO_STATS_CHANNEL}', COALESCE(current_setting('app.notify_tag', true), ''));
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    _create_trigger_if_missing("portfolio_stats_changed", "portfolio_stats", "notify_portfolio_stats_changed"),
+    # Version counters for ETags. The bump is an UPDATE in the writing transaction, so a new
+    # version becomes visible exactly when the rows it covers do, whatever order writers
+    # commit in. Writers to one table queue on its counter row only between their last
+    # statement and commit.
+    """
+    CREATE TABLE IF NOT EXISTS table_versions (
+        name text PRIMARY KEY,
+        version bigint NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT INTO table_versions (name) VALUES ('users') ON CONFLICT DO NOTHING",
+    """
+    CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    _create_trigger_if_missing("users_version", "users", "bump_table_version"),
+    """
+    CREATE TABLE IF NOT EXISTS risk_limits (
+        scope text NOT NULL CHECK (scope IN ('user', 'portfolio')),
+        scope_id integer NOT NULL,
+        max_position integer,
+        max_order_notional numeric,
+        PRIMARY KEY (scope, scope_id)
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS restricted_symbols (symbol text PRIMARY KEY)",
+    f"""
+    CREATE OR REPLACE FUNCTION notify_risk_limits_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{RISK_LIMITS_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    _create_trigger_if_missing("risk_limits_changed", "risk_limits", "notify_risk_limits_changed"),
+    _create_trigger_if_missing("restricted_symbols_changed", "restricted_symbols", "notify_risk_limits_changed"),
+]
+
+
+# (name, table and columns) built with CREATE INDEX CONCURRENTLY, so writes to the table
+# carry on while a build runs on a live database
+INDEXES = [
+    # Latest value per portfolio is a backward scan of one index range, not a sort
+    ("portfolio_stats_portfolio_created_idx", "portfolio_stats (portfolio_id, created_at DESC)"),
+    ("portfolio_stats_created_idx", "portfolio_stats (created_at DESC)"),
+    # Newest-user lookup for the /users ETag watermark
+    ("users_created_at_idx", "users (created_at)"),
+    ("positions_user_portfolio_idx", "positions (user_id, portfolio_id)"),
+    # Fill rows are looked up by (portfolio_id, stock)
+    ("positions_portfolio_stock_idx", "positions (portfolio_id, stock)"),
+]
+
+UNIQUE_INDEXES = [
+    # POST /users relies on it to reject a duplicate email under concurrent inserts. Named
+    # like the index of a UNIQUE (email) column constraint, so an existing one is reused.
+    ("users_email_key", "users (email)"),
+]
+
+INVALID_INDEX_SQL = text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)")
+
+# A concurrent build in progress, on this instance or another, shows up here
+BUILDING_INDEX_SQL = text("SELECT EXISTS (SELECT 1 FROM pg_stat_progress_create_index WHERE index_relid = to_regclass(:name))")
+
+
+async def ensure_schema(engine: AsyncEngine):
+    for statement in SCHEMA_STATEMENTS:
+        try:
+            async with engine.begin() as connection:
+                await connection.execute(text(statement))
+        except Exception:
+            # Not fatal: a missing trigger leaves caches on their TTL
+            logger.exception("Failed to apply schema statement")
+
+
+class IndexBuilder:
+    """Builds INDEXES and UNIQUE_INDEXES in the background, so serving never waits on them.
+
+    A first build on a large table can take minutes. Run from the lifespan it would hold
+    readiness, and an instance killed mid-build leaves an invalid index behind. Such a
+    leftover is dropped and rebuilt here unless some instance is still building it.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(ensure_indexes(self.engine))
+
+    async def stop(self):
+        # A cancelled build leaves an invalid index, which the next start rebuilds
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+async def ensure_indexes(engine: AsyncEngine):
+    indexes = [("INDEX", name, definition) for name, definition in INDEXES]
+    indexes += [("UNIQUE INDEX", name, definition) for name, definition in UNIQUE_INDEXES]
+    try:
+        # CONCURRENTLY cannot run inside a transaction block
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            for kind, name, definition in indexes:
+                try:
+                    if (await connection.execute(INVALID_INDEX_SQL, {"name": name})).scalar():
+                        if (await connection.execute(BUILDING_INDEX_SQL, {"name": name})).scalar():
+                            logger.info("Index %s is being built elsewhere; leaving it", name)
+                            continue
+                        # Left by an interrupted build; IF NOT EXISTS would skip it forever
+                        logger.warning("Rebuilding invalid index %s", name)
+                        await connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                    await connection.execute(text(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # Not fatal: missing indexes cost speed
+                    logger.exception("Failed to create index %s", name)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # Not fatal either: the database may be down at startup, like the steps around it allow
+        logger.exception("Failed to connect to create indexes")
+
+
+index_builder = IndexBuilder(engine)
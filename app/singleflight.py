@@ -0,0 +1,69 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key onto one in-flight awaitable."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executed = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.executed += 1
+            # Run the call in its own task so a cancelled caller does not cancel it for the others
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved in case every waiter went away
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+groups: Dict[str, SingleFlight] = {}
+
+
+def stats() -> dict:
+    return {name: group.stats() for name, group in groups.items()}
+
+
+def coalesce(name: str = None):
+    """Decorator: concurrent calls with equal arguments share one result.
+
+    The shared call runs in its own task and can outlive the caller that started it, so a
+    coalesced function opens whatever per-call resources it needs, such as a session,
+    instead of taking them from a request.
+    """
+
+    def decorator(handler):
+        # Qualified, so same-named functions in different modules never share results
+        group_name = name or f"{handler.__module__}.{handler.__qualname__}"
+        group = groups.setdefault(group_name, SingleFlight(group_name))
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return await group.do(key, lambda: handler(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,432 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+import numpy as np
+from sqlalchemy import DateTime, Float, Integer, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import metrics
+from .cache import portfolio_value_cache
+from .database import SessionLocal
+from .models import PositionCreate
+from .prices import price_store
+from .querystats import query_stats
+
+logger = logging.getLogger(__name__)
+
+INSERT_PORTFOLIO_STATS_SQL = text("""
+    INSERT INTO portfolio_stats (portfolio_id, portfolio_value, created_at)
+    SELECT portfolio_id, portfolio_value, :created_at
+    FROM unnest(:portfolio_ids, :portfolio_values) AS v(portfolio_id, portfolio_value)
+""").bindparams(
+    bindparam("portfolio_ids", type_=ARRAY(Integer)),
+    bindparam("portfolio_values", type_=ARRAY(Float)),
+    bindparam("created_at", type_=DateTime)
+)
+
+# Latest value of each given portfolio: one index probe per id via LATERAL rather than a
+# DISTINCT ON over every row of each portfolio
+LATEST_PORTFOLIO_VALUES_SQL = text("""
+    SELECT ids.portfolio_id, latest.portfolio_value, latest.created_at
+    FROM unnest(:portfolio_ids) AS ids(portfolio_id)
+    CROSS JOIN LATERAL (
+        SELECT portfolio_value, created_at FROM portfolio_stats s
+        WHERE s.portfolio_id = ids.portfolio_id
+        ORDER BY s.created_at DESC LIMIT 1
+    ) latest
+""").bindparams(bindparam("portfolio_ids", type_=ARRAY(Integer)))
+
+# The portfolio_stats NOTIFY carries this setting as its payload (see schema.py), so
+# listeners can tell a flush of ours, already handed to the flush listeners, from any
+# other write. Transaction-local, so it ends with the flush's commit.
+SET_NOTIFY_TAG_SQL = text("SELECT set_config('app.notify_tag', :tag, true)")
+
+# Most recent stored value per portfolio, read in one pass over portfolio_stats_portfolio_created_idx
+LATEST_PORTFOLIO_STATS_SQL = text("""
+    SELECT DISTINCT ON (portfolio_id) portfolio_id, portfolio_value
+    FROM portfolio_stats
+    ORDER BY portfolio_id, created_at DESC
+""")
+
+
+class PositionMatrix:
+    """Positions as parallel arrays, with portfolios and symbols encoded as dense indices.
+
+    portfolio_index[i] and symbol_index[i] point into portfolio_ids and symbols, so a
+    valuation is one gather of prices and one grouped sum (bincount) over positions.
+    """
+
+    def __init__(self, portfolio_ids: np.ndarray, symbols: np.ndarray,
+                 portfolio_index: np.ndarray, symbol_index: np.ndarray, quantities: np.ndarray):
+        self.portfolio_ids = portfolio_ids
+        self.symbols = symbols
+        self.portfolio_index = portfolio_index
+        self.symbol_index = symbol_index
+        self.quantities = quantities
+
+    @classmethod
+    def from_columns(cls, portfolio_ids, stocks, quantities) -> "PositionMatrix":
+        unique_portfolios, portfolio_index = np.unique(np.asarray(portfolio_ids, dtype=np.int64), return_inverse=True)
+        unique_symbols, symbol_index = np.unique(np.asarray(stocks, dtype=object).astype(str), return_inverse=True)
+        return cls(
+            unique_portfolios,
+            unique_symbols,
+            portfolio_index.astype(np.intp),
+            symbol_index.astype(np.intp),
+            np.asarray(quantities, dtype=np.float64)
+        )
+
+    def price_vector(self, prices: Mapping[str, float]) -> np.ndarray:
+        # One lookup per distinct symbol, not per position; unpriced symbols become NaN
+        return np.fromiter((prices.get(s, np.nan) for s in self.symbols), dtype=np.float64, count=len(self.symbols))
+
+    def value(self, price_vector: np.ndarray) -> np.ndarray:
+        """Value every portfolio; NaN marks a portfolio holding an unpriced symbol."""
+        position_values = self.quantities * price_vector[self.symbol_index]
+        return np.bincount(self.portfolio_index, weights=position_values, minlength=len(self.portfolio_ids))
+
+
+# Symbols travel as 64-bit hashes so every COPY row below has a fixed width. The map back
+# to names is one row per distinct symbol.
+POSITION_SYMBOLS_SQL = text("""
+    SELECT stock, hashtextextended(stock, 0) FROM positions WHERE stock IS NOT NULL GROUP BY stock
+""")
+
+# Binary COPY, parsed straight into arrays: no per-row Python objects, and no join on the
+# server. NULLs are filtered out since a NULL field would break the fixed row width.
+# positions is not ours, so the casts pin each field's wire width whatever the column
+# types are; a value that does not fit makes the cast, and so the load, fail.
+POSITION_COLUMNS_COPY = """
+    SELECT portfolio_id::int4, hashtextextended(stock, 0)::int8, COALESCE(quantity, 0)::int8 FROM positions
+    WHERE portfolio_id IS NOT NULL AND stock IS NOT NULL
+"""
+
+# One binary COPY row: field count, then a length word before each field (big-endian)
+POSITION_ROW_DTYPE = np.dtype([
+    ("fields", ">i2"),
+    ("portfolio_id_length", ">i4"), ("portfolio_id", ">i4"),
+    ("symbol_hash_length", ">i4"), ("symbol_hash", ">i8"),
+    ("quantity_length", ">i4"), ("quantity", ">i8"),
+])
+POSITION_FIELD_COUNT = 3
+# 11-byte signature, flags and header extension length before the rows; -1 field count after
+COPY_BINARY_HEADER_SIZE = 19
+COPY_BINARY_TRAILER_SIZE = 2
+
+
+async def _copy_position_columns(session: AsyncSession) -> np.ndarray:
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    chunks: List[bytes] = []
+
+    async def collect(chunk: bytes):
+        chunks.append(chunk)
+
+    # Not a SQLAlchemy statement, so the cursor events do not time it
+    started = time.perf_counter()
+    await raw.driver_connection.copy_from_query(POSITION_COLUMNS_COPY, output=collect, format="binary")
+    elapsed = time.perf_counter() - started
+    metrics.record_db_time(elapsed)
+    query_stats.record(POSITION_COLUMNS_COPY, None, False, elapsed)
+
+    data = b"".join(chunks)
+    size = len(data) - COPY_BINARY_HEADER_SIZE - COPY_BINARY_TRAILER_SIZE
+    if size % POSITION_ROW_DTYPE.itemsize or data[-COPY_BINARY_TRAILER_SIZE:] != b"\xff\xff":
+        raise ValueError("Unexpected binary COPY layout for positions")
+    rows = np.frombuffer(data, dtype=POSITION_ROW_DTYPE, count=size // POSITION_ROW_DTYPE.itemsize,
+                         offset=COPY_BINARY_HEADER_SIZE)
+    # The row count alone can line up by chance; every length word must match the dtype
+    if (np.any(rows["fields"] != POSITION_FIELD_COUNT) or np.any(rows["portfolio_id_length"] != 4)
+            or np.any(rows["symbol_hash_length"] != 8) or np.any(rows["quantity_length"] != 8)):
+        raise ValueError("Unexpected binary COPY layout for positions")
+    return rows
+
+
+async def load_positions(session: AsyncSession) -> PositionMatrix:
+    if not session.in_transaction():
+        # Both statements below must read the same snapshot of positions
+        await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    symbols = (await session.execute(POSITION_SYMBOLS_SQL)).all()
+    names = np.array([row[0] for row in symbols], dtype=str)
+    hashes = np.fromiter((row[1] for row in symbols), dtype=np.int64, count=len(symbols))
+    order = np.argsort(hashes)
+    names, hashes = names[order], hashes[order]
+    if np.any(hashes[1:] == hashes[:-1]):
+        # Two symbols share a hash; decode the rows the slow way instead
+        return await _load_position_rows(session)
+
+    rows = await _copy_position_columns(session)
+    unique_portfolios, portfolio_index = np.unique(rows["portfolio_id"], return_inverse=True)
+    return PositionMatrix(
+        unique_portfolios.astype(np.int64),
+        names,
+        portfolio_index.astype(np.intp),
+        np.searchsorted(hashes, rows["symbol_hash"]).astype(np.intp),
+        rows["quantity"].astype(np.float64)
+    )
+
+
+async def _load_position_rows(session: AsyncSession) -> PositionMatrix:
+    result = await session.execute(text("SELECT portfolio_id, stock, quantity FROM positions"))
+    rows = result.all()
+    if not rows:
+        return PositionMatrix.from_columns([], [], [])
+    portfolio_ids, stocks, quantities = zip(*rows)
+    return PositionMatrix.from_columns(portfolio_ids, stocks, quantities)
+
+
+async def write_portfolio_values(session: AsyncSession, portfolio_ids: np.ndarray, values: np.ndarray,
+                                 created_at: Optional[datetime] = None) -> int:
+    if len(portfolio_ids) == 0:
+        return 0
+    await session.execute(
+        INSERT_PORTFOLIO_STATS_SQL,
+        {
+            "portfolio_ids": portfolio_ids.tolist(),
+            "portfolio_values": values.tolist(),
+            "created_at": created_at or datetime.utcnow()
+        }
+    )
+    return len(portfolio_ids)
+
+
+async def revalue_all(session: AsyncSession, prices: Mapping[str, float]) -> dict:
+    positions = await load_positions(session)
+    values = positions.value(positions.price_vector(prices))
+    priced = ~np.isnan(values)
+    written = await write_portfolio_values(session, positions.portfolio_ids[priced], values[priced])
+    await session.commit()
+    return {
+        "valued": written,
+        "unpriced_portfolios": positions.portfolio_ids[~priced].tolist()
+    }
+
+
+# Rows applied between yields to the event loop while the valuer loads
+LOAD_YIELD_ROWS = 10000
+
+
+class IncrementalValuer:
+    """Keeps portfolio totals current under price ticks and position changes.
+
+    Each symbol maps to the portfolio slots that hold it and their quantities, so a tick
+    touches only that symbol's holders. Portfolios that changed are marked dirty and
+    flush() appends portfolio_stats rows only where the total actually moved. Position
+    changes schedule a flush of their own, since no price tick may follow them.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        # Position changes seen while the initial load runs, replayed once it finishes
+        self._loading: Optional[List[PositionCreate]] = None
+        self._slots: Dict[int, int] = {}
+        self._portfolio_ids = np.zeros(0, dtype=np.int64)
+        self._totals = np.zeros(0, dtype=np.float64)
+        self._unpriced = np.zeros(0, dtype=np.int64)
+        self._last_written = np.zeros(0, dtype=np.float64)
+        self._dirty = np.zeros(0, dtype=bool)
+        self._holdings: Dict[str, Dict[int, float]] = {}
+        self._holder_arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._positions: Dict[int, Tuple[int, str, float]] = {}
+        self._prices: Dict[str, float] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._flush_listeners: List[Callable[[np.ndarray, np.ndarray], None]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_pending = False
+        self._load_task: Optional[asyncio.Task] = None
+        # Unique to this process: another instance's flushes are news to our listeners
+        self.notify_tag = f"valuer-{uuid.uuid4().hex}"
+
+    def add_flush_listener(self, listener: Callable[[np.ndarray, np.ndarray], None]):
+        """Called with (portfolio_ids, values) for every committed flush."""
+        self._flush_listeners.append(listener)
+
+    def lock(self) -> asyncio.Lock:
+        # Created on first use so it binds to the running loop (Python 3.9 binds at construction)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def start(self):
+        """Load in the background at startup, so the first price ingest does not pay for it."""
+        self._load_task = asyncio.create_task(self._load_at_startup())
+
+    async def stop(self):
+        if self._load_task:
+            self._load_task.cancel()
+            try:
+                await self._load_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _load_at_startup(self):
+        try:
+            async with SessionLocal() as session:
+                await self.ensure_loaded(session)
+        except Exception:
+            # Not fatal: the next price ingest or valuation retries the load
+            logger.exception("Failed to load positions for incremental valuation")
+
+    async def ensure_loaded(self, session: AsyncSession):
+        async with self.lock():
+            if self.loaded:
+                return
+            # on_positions buffers until loaded is set, across every await below
+            self._loading = []
+            try:
+                result = await session.execute(text("SELECT position_id, portfolio_id, stock, quantity FROM positions"))
+                # Prices ingested before the first load seed the totals; later ticks arrive via on_prices
+                self._prices = price_store.as_dict()
+                for i, (position_id, portfolio_id, stock, quantity) in enumerate(result.all(), 1):
+                    self._apply_position(position_id, portfolio_id, stock, quantity)
+                    # A million rows take over a second; let other requests run in between
+                    if i % LOAD_YIELD_ROWS == 0:
+                        await asyncio.sleep(0)
+                # Start from what is already stored so the first flush skips unchanged totals
+                result = await session.execute(LATEST_PORTFOLIO_STATS_SQL)
+                for portfolio_id, portfolio_value in result.all():
+                    slot = self._slots.get(portfolio_id)
+                    if slot is not None and portfolio_value is not None:
+                        self._last_written[slot] = portfolio_value
+                # Changes committed after the snapshot would otherwise be lost; replaying
+                # ones it already holds is harmless, as positions are applied by value.
+                # No await between the replay and loaded, so nothing slips through.
+                replay = self._loading
+                for p in replay:
+                    self._apply_position(p.position_id, p.portfolio_id, p.stock, p.quantity)
+                self.loaded = True
+            finally:
+                self._loading = None
+        if replay:
+            self.flush_soon()
+
+    def _slot(self, portfolio_id: int) -> int:
+        slot = self._slots.get(portfolio_id)
+        if slot is not None:
+            return slot
+        slot = len(self._slots)
+        if slot == len(self._totals):
+            capacity = max(1024, 2 * slot)
+            self._portfolio_ids = np.resize(self._portfolio_ids, capacity)
+            self._totals = np.concatenate([self._totals, np.zeros(capacity - slot)])
+            self._unpriced = np.concatenate([self._unpriced, np.zeros(capacity - slot, dtype=np.int64)])
+            self._last_written = np.concatenate([self._last_written, np.full(capacity - slot, np.nan)])
+            self._dirty = np.concatenate([self._dirty, np.zeros(capacity - slot, dtype=bool)])
+        self._slots[portfolio_id] = slot
+        self._portfolio_ids[slot] = portfolio_id
+        return slot
+
+    def _adjust_holding(self, slot: int, symbol: str, delta: float):
+        holders = self._holdings.setdefault(symbol, {})
+        before = holders.get(slot)
+        after = (before or 0.0) + delta
+        if after == 0:
+            holders.pop(slot, None)
+        else:
+            holders[slot] = after
+        self._holder_arrays.pop(symbol, None)
+
+        price = self._prices.get(symbol)
+        if price is None:
+            # Track how many held symbols lack a price; such totals are incomplete
+            self._unpriced[slot] += (after != 0) - (before is not None)
+        else:
+            self._totals[slot] += delta * price
+        self._dirty[slot] = True
+
+    def _apply_position(self, position_id: int, portfolio_id: int, stock: str, quantity: float):
+        previous = self._positions.get(position_id)
+        if previous is not None:
+            self._adjust_holding(previous[0], previous[1], -previous[2])
+        slot = self._slot(portfolio_id)
+        self._positions[position_id] = (slot, stock, quantity)
+        self._adjust_holding(slot, stock, quantity)
+
+    def on_positions(self, positions: Iterable[PositionCreate]):
+        if self._loading is not None:
+            self._loading.extend(positions)
+            return
+        if not self.loaded:
+            return
+        for p in positions:
+            self._apply_position(p.position_id, p.portfolio_id, p.stock, p.quantity)
+        self.flush_soon()
+
+    def _holders(self, symbol: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._holder_arrays.get(symbol)
+        if arrays is None:
+            holders = self._holdings.get(symbol, {})
+            arrays = (
+                np.fromiter(holders.keys(), dtype=np.intp, count=len(holders)),
+                np.fromiter(holders.values(), dtype=np.float64, count=len(holders))
+            )
+            self._holder_arrays[symbol] = arrays
+        return arrays
+
+    def on_price(self, symbol: str, price: float):
+        previous = self._prices.get(symbol)
+        if previous == price:
+            return
+        self._prices[symbol] = price
+        slots, quantities = self._holders(symbol)
+        if len(slots) == 0:
+            return
+        if previous is None:
+            self._totals[slots] += quantities * price
+            self._unpriced[slots] -= 1
+        else:
+            self._totals[slots] += quantities * (price - previous)
+        self._dirty[slots] = True
+
+    def on_prices(self, prices: Mapping[str, float]):
+        for symbol, price in prices.items():
+            self.on_price(symbol, price)
+
+    def changed(self) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(self._slots)
+        dirty = np.flatnonzero(self._dirty[:n] & (self._unpriced[:n] == 0))
+        totals = self._totals[dirty]
+        moved = ~np.isclose(totals, self._last_written[dirty], rtol=1e-12, atol=1e-9)
+        return dirty[moved], totals[moved]
+
+    async def flush(self, session: AsyncSession) -> int:
+        async with self.lock():
+            slots, totals = self.changed()
+            n = len(self._slots)
+            # Clear before awaiting so updates that land during the write stay dirty;
+            # unpriced portfolios stay dirty until their last symbol gets a price
+            self._dirty[:n] &= self._unpriced[:n] != 0
+            try:
+                await session.execute(SET_NOTIFY_TAG_SQL, {"tag": self.notify_tag})
+                written = await write_portfolio_values(session, self._portfolio_ids[slots], totals)
+                await session.commit()
+            except Exception:
+                self._dirty[slots] = True
+                raise
+            self._last_written[slots] = totals
+            if written:
+                for listener in self._flush_listeners:
+                    listener(self._portfolio_ids[slots], totals)
+            return written
+
+    def flush_soon(self):
+        # Changes made while a flush is writing are picked up by one more pass
+        self._flush_pending = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_while_pending())
+
+    async def _flush_while_pending(self):
+        while self._flush_pending:
+            self._flush_pending = False
+            try:
+                async with SessionLocal() as session:
+                    if await self.flush(session):
+                        portfolio_value_cache.invalidate()
+            except Exception:
+                logger.exception("Failed to flush portfolio values")
+
+
+incremental_valuer = IncrementalValuer()
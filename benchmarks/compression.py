@@ -0,0 +1,48 @@
+"""Size and CPU time of each negotiated coding on /users-shaped JSON (no database needed).
+
+    python benchmarks/compression.py --sizes 1000 100000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/benchmark")
+
+import orjson  # noqa: E402
+from app.compression import ENCODERS  # noqa: E402
+
+FIELDS = ["id", "email", "name", "created_at"]
+
+
+def make_body(count):
+    start = datetime(2024, 1, 1)
+    rows = [
+        (i, f"user{i}@example.com", f"User {i}", start + timedelta(seconds=i * 37, microseconds=i % 1000))
+        for i in range(1, count + 1)
+    ]
+    return orjson.dumps({"users": [dict(zip(FIELDS, row)) for row in rows], "next_cursor": None})
+
+
+def main(sizes, repeat):
+    for size in sizes:
+        body = make_body(size)
+        print(f"{size:,} users, {len(body) / 1e6:.2f} MB of JSON")
+        for name, encoder in ENCODERS.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                compressed = encoder.compress(body)
+                timings.append(time.perf_counter() - start)
+            print(f"  {name:<5} {len(compressed) / 1e3:9.1f} kB  ({len(body) / len(compressed):5.1f}x)  "
+                  f"{min(timings) * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.sizes, args.repeat)
@@ -0,0 +1,97 @@
+"""RSS growth while streaming GET /users/export's generator over a large users table.
+
+Runs export_users in-process against DATABASE_URL and samples resident memory after
+every chunk. Exits non-zero if RSS grows by more than --max-growth-mb after the first
+chunk. Point it at a scratch database; --seed fills users up to the given row count:
+
+    DATABASE_URL=postgresql://localhost/scratch python benchmarks/export_memory.py --seed 1000000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import text  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.routes.users import export_users, format_csv, format_ndjson  # noqa: E402
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE / 1e6
+
+
+async def seed(rows):
+    async with engine.begin() as connection:
+        await connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id integer PRIMARY KEY,
+                email text UNIQUE,
+                name text,
+                created_at timestamp DEFAULT now(),
+                last_login timestamp
+            )
+        """))
+        existing = (await connection.execute(text("SELECT count(*) FROM users"))).scalar()
+        if existing < rows:
+            await connection.execute(text("""
+                INSERT INTO users (user_id, email, name)
+                SELECT g, 'export' || g || '@example.com', 'Export User ' || g
+                FROM generate_series(
+                    (SELECT COALESCE(max(user_id), 0) + 1 FROM users),
+                    (SELECT COALESCE(max(user_id), 0) FROM users) + :missing
+                ) g
+            """), {"missing": rows - existing})
+
+
+async def run(formatter, max_growth_mb):
+    rows = chunks = size = 0
+    baseline = peak = None
+    start = time.perf_counter()
+    async for chunk in export_users(formatter):
+        chunks += 1
+        size += len(chunk)
+        rows += chunk.count(b"\n" if isinstance(chunk, bytes) else "\n")
+        current = rss_mb()
+        if baseline is None:
+            # Measured after the first chunk, once the connection and cursor exist
+            baseline = current
+        peak = max(peak or current, current)
+    elapsed = time.perf_counter() - start
+
+    growth = peak - baseline
+    print(f"{rows:,} rows in {chunks:,} chunks, {size / 1e6:.0f} MB streamed in {elapsed:.1f}s")
+    print(f"RSS after first chunk {baseline:.0f} MB, peak {peak:.0f} MB, growth {growth:.1f} MB "
+          f"(limit {max_growth_mb} MB)")
+    return growth <= max_growth_mb
+
+
+async def check(seed_rows, formatter, max_growth_mb):
+    try:
+        if seed_rows:
+            await seed(seed_rows)
+        return await run(formatter, max_growth_mb)
+    finally:
+        await engine.dispose()
+
+
+def main(seed_rows, fmt, max_growth_mb):
+    formatter = format_csv if fmt == "csv" else format_ndjson
+    if not asyncio.run(check(seed_rows, formatter, max_growth_mb)):
+        print("FAIL: RSS grew with the size of the export")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0, help="ensure users holds at least this many rows")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--max-growth-mb", type=float, default=50)
+    args = parser.parse_args()
+    main(args.seed, args.format, args.max_growth_mb)
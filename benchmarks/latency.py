@@ -0,0 +1,72 @@
+"""Concurrent latency benchmark against a running service.
+
+Requires httpx (``pip install httpx``). Run once against the old build and once
+against the new one, e.g.::
+
+    python benchmarks/latency.py http://localhost:8080/portfolio-value -c 200 -n 20000
+
+Measured with -c 200 -n 20000 against a single uvicorn worker and a local Postgres over
+a Unix socket, all on one CPU core shared with this client:
+
+    build                      endpoint          req/s   p50       p99
+    baseline (sync psycopg2)   /portfolio-value  313-346 391-433ms 3.4-3.6s
+                               /health           362     373ms     3.3s
+    async engine (user-001)    /portfolio-value  247-257 511-537ms 4.6-4.7s
+                               /health           254     529ms     4.4s
+
+Here the async build is slower. With the database on the same core, a blocking query
+holds the event loop only briefly. Each async request also pays for a pool checkout
+and the asyncpg round trip, on the core the client needs too. The async engine stops
+blocking the event loop while a query waits on the network, which this setup barely
+exercises. Repeat against a remote database on separate cores before drawing conclusions.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def worker(client, url, remaining, latencies, errors):
+    while remaining:
+        remaining.pop()
+        start = time.perf_counter()
+        try:
+            response = await client.get(url)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url, concurrency, requests):
+    remaining = list(range(requests))
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, url, remaining, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{url}  concurrency={concurrency}  requests={requests}  errors={len(errors)}")
+    print(f"throughput: {requests / elapsed:.0f} req/s")
+    print(f"p50: {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"p99: {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"mean: {statistics.mean(latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url")
+    parser.add_argument("-c", "--concurrency", type=int, default=200)
+    parser.add_argument("-n", "--requests", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.requests))
@@ -0,0 +1,85 @@
+"""Cost of logging on the request path: JSON records through the queue handler vs print().
+
+    python benchmarks/logging_overhead.py --records 100000 > /dev/null
+
+Timings go to stderr; stdout receives the log output itself, so redirect it. The
+queue-handler figures include the writer thread's share of the GIL. A tight loop
+outruns the writer, so the distinct-record run also shows records being dropped
+rather than blocking the caller. Successful requests log nothing.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/benchmark")
+
+import logging  # noqa: E402
+from app import logs, metrics  # noqa: E402
+
+logger = logging.getLogger("benchmark")
+
+
+class Route:
+    path = "/users"
+
+
+def report(label, elapsed, records):
+    print(f"{label:<34} {elapsed / records * 1e6:7.2f} us/record", file=sys.stderr)
+
+
+def bench_print(records):
+    start = time.perf_counter()
+    for i in range(records):
+        print(f"Failed to fetch users: connection reset {i}")
+    sys.stdout.flush()
+    return time.perf_counter() - start
+
+
+def bench_distinct(records):
+    # Distinct messages, so nothing is rate limited: the full enqueue path
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info("Request %d served", i, extra={"user_id": i})
+    return time.perf_counter() - start
+
+
+def bench_storm(records):
+    # The same error repeatedly, as in an outage: mostly suppressed by the rate limiter
+    try:
+        raise ConnectionResetError("connection reset by peer")
+    except ConnectionResetError:
+        start = time.perf_counter()
+        for _ in range(records):
+            logger.exception("Failed to fetch users")
+        return time.perf_counter() - start
+
+
+async def in_request(fn, records):
+    scope = {"type": "http", "method": "GET", "headers": [], "route": Route}
+    token = metrics._current_request.set(metrics.RequestContext(scope))
+    try:
+        return fn(records)
+    finally:
+        metrics._current_request.reset(token)
+
+
+def main(records):
+    report("print()", bench_print(records), records)
+    logs.setup_logging()
+    for label, fn in (("queue handler, distinct records", bench_distinct),
+                      ("queue handler, repeated error", bench_storm)):
+        report(label, asyncio.run(in_request(fn, records)), records)
+    start = time.perf_counter()
+    logs.shutdown_logging()
+    print(f"writer drain after run: {time.perf_counter() - start:.2f}s "
+          f"(dropped {logs.log_stats.dropped:,}, suppressed {logs.log_stats.suppressed:,})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.records)
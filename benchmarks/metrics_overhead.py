@@ -0,0 +1,55 @@
+"""Per-request cost of MetricsMiddleware around a no-op ASGI app (no database or server needed).
+
+    python benchmarks/metrics_overhead.py --requests 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/benchmark")
+
+from app.metrics import MetricsMiddleware  # noqa: E402
+
+
+class Route:
+    path = "/portfolios/{portfolio_id}/value"
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def run(app, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET", "path": "/portfolios/1/value"}, receive, send)
+    return time.perf_counter() - start
+
+
+def main(requests):
+    bare = asyncio.run(run(endpoint, requests))
+    wrapped = asyncio.run(run(MetricsMiddleware(endpoint), requests))
+    overhead_us = (wrapped - bare) / requests * 1e6
+    print(f"bare:       {bare / requests * 1e6:.2f} us/request")
+    print(f"middleware: {wrapped / requests * 1e6:.2f} us/request")
+    print(f"overhead:   {overhead_us:.2f} us/request (budget 20 us)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+    main(args.requests)
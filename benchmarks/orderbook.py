@@ -0,0 +1,81 @@
+"""Sustained add/cancel/match throughput on one symbol's book (no database needed).
+
+    python benchmarks/orderbook.py --resting 10000 --operations 500000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/benchmark")
+
+from app.orderbook import BUY, SELL, OrderBooks  # noqa: E402
+
+
+def main(resting, operations, seed):
+    rng = random.Random(seed)
+    books = OrderBooks()
+    next_id = 0
+    # Resting ids in a swap-remove list, with each id's slot so filled makers can be dropped
+    live = []
+    slots = {}
+
+    def forget(order_id):
+        i = slots.pop(order_id)
+        last = live.pop()
+        if last != order_id:
+            live[i] = last
+            slots[last] = i
+
+    def add_passive():
+        nonlocal next_id
+        side = rng.choice((BUY, SELL))
+        # Bids below 100, asks above, so seeding does not cross
+        price = round(100 - rng.uniform(0.01, 5), 2) if side == BUY else round(100 + rng.uniform(0.01, 5), 2)
+        books.submit(next_id, 1, 1, "SYM", side, price, rng.randint(1, 100))
+        slots[next_id] = len(live)
+        live.append(next_id)
+        next_id += 1
+
+    for _ in range(resting):
+        add_passive()
+
+    adds = cancels = matches = fills = 0
+    start = time.perf_counter()
+    for _ in range(operations):
+        roll = rng.random()
+        if roll < 0.2 and live:
+            side = rng.choice((BUY, SELL))
+            market_fills = books.submit(next_id, 2, 2, "SYM", side, None, rng.randint(1, 200))
+            for fill in market_fills:
+                if fill.maker.quantity == 0:
+                    forget(fill.maker.order_id)
+            fills += len(market_fills)
+            next_id += 1
+            matches += 1
+        elif len(live) < resting:
+            # Adds and cancels alternate around the target so the book holds its size
+            add_passive()
+            adds += 1
+        else:
+            order_id = live[rng.randrange(len(live))]
+            forget(order_id)
+            if books.cancel(order_id) is None:
+                raise RuntimeError(f"order {order_id} was not resting")
+            cancels += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"start resting={resting:,}  end resting={books.stats()['resting_orders']:,}")
+    print(f"{operations:,} ops in {elapsed:.2f}s: {operations / elapsed:,.0f} ops/s")
+    print(f"adds={adds:,} cancels={cancels:,} market orders={matches:,} fills={fills:,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resting", type=int, default=10000)
+    parser.add_argument("--operations", type=int, default=500000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.resting, args.operations, args.seed)
@@ -0,0 +1,55 @@
+"""POST /orders throughput at a given concurrency, against a running service.
+
+Requires httpx (``pip install httpx``)::
+
+    python benchmarks/orders_throughput.py http://localhost:8080 -c 200 -n 20000
+
+Compare with POST /users at the same concurrency for the one-INSERT-per-request baseline.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def worker(client, remaining, latencies, errors):
+    while remaining:
+        i = remaining.pop()
+        order = {
+            "user_id": i % 1000,
+            "portfolio_id": i % 100,
+            "symbol": f"SYM{i % 50}",
+            "side": "buy" if i % 2 else "sell",
+            "quantity": 1 + i % 10
+        }
+        start = time.perf_counter()
+        response = await client.post("/orders", json=order)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+
+async def run(base_url, concurrency, requests):
+    remaining = list(range(requests))
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, remaining, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{requests} orders  concurrency={concurrency}  errors={len(errors)}")
+    print(f"throughput: {requests / elapsed:,.0f} orders/s")
+    print(f"p50: {latencies[len(latencies) // 2] * 1000:.1f} ms  p99: {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        print((await client.get("/orders/writer")).json())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_url")
+    parser.add_argument("-c", "--concurrency", type=int, default=200)
+    parser.add_argument("-n", "--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.concurrency, args.requests))
@@ -0,0 +1,48 @@
+"""Position ingestion throughput at different batch sizes.
+
+Requires httpx (``pip install httpx``) and a running service::
+
+    python benchmarks/positions_throughput.py http://localhost:8080 --total 100000
+"""
+import argparse
+import time
+
+import httpx
+
+
+def make_positions(start, count):
+    return [
+        {
+            "position_id": i,
+            "portfolio_id": i % 5000,
+            "portfolio_name": f"portfolio-{i % 5000}",
+            "user_id": i % 1000,
+            "stock": f"SYM{i % 500}",
+            "quantity": 1 + i % 100
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def run(base_url, batch_size, total):
+    with httpx.Client(base_url=base_url, timeout=120) as client:
+        start = time.perf_counter()
+        for offset in range(0, total, batch_size):
+            batch = make_positions(offset, min(batch_size, total - offset))
+            if batch_size == 1:
+                response = client.post("/positions", json=batch[0])
+            else:
+                response = client.post("/positions/batch", json=batch)
+            response.raise_for_status()
+        elapsed = time.perf_counter() - start
+    print(f"batch={batch_size:>6}  {total} positions in {elapsed:.2f}s  {total / elapsed:,.0f} positions/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_url")
+    parser.add_argument("--total", type=int, default=100000)
+    args = parser.parse_args()
+    for batch_size in (1, 100, 10000):
+        # Single-row inserts are slow; keep that run short
+        run(args.base_url, batch_size, min(args.total, 2000) if batch_size == 1 else args.total)
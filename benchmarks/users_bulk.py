@@ -0,0 +1,47 @@
+"""POST /users/bulk throughput, as JSON and as NDJSON, against a running service.
+
+Requires httpx (``pip install httpx``). Each run inserts --total new users, so point it at
+a scratch database and pass a --start beyond the ids already there::
+
+    python benchmarks/users_bulk.py http://localhost:8080 --total 100000 --start 10000000
+"""
+import argparse
+import time
+
+import httpx
+import orjson
+
+
+def make_users(start, count):
+    return [
+        {"user_id": i, "email": f"bulk-{i}@example.com", "name": f"Bulk User {i}"}
+        for i in range(start, start + count)
+    ]
+
+
+def run(client, users, ndjson):
+    if ndjson:
+        body = b"".join(orjson.dumps(user) + b"\n" for user in users)
+        headers = {"Content-Type": "application/x-ndjson"}
+    else:
+        body = orjson.dumps(users)
+        headers = {"Content-Type": "application/json"}
+    start = time.perf_counter()
+    response = client.post("/users/bulk", content=body, headers=headers)
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    result = response.json()
+    label = "ndjson" if ndjson else "json"
+    print(f"{label:>6}  {len(users)} users in {elapsed:.2f}s  {len(users) / elapsed:,.0f} users/s  "
+          f"created={result['created']} failed={len(result['failed'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_url")
+    parser.add_argument("--total", type=int, default=100000)
+    parser.add_argument("--start", type=int, default=10000000)
+    args = parser.parse_args()
+    with httpx.Client(base_url=args.base_url, timeout=300) as client:
+        run(client, make_users(args.start, args.total), ndjson=False)
+        run(client, make_users(args.start + args.total, args.total), ndjson=True)
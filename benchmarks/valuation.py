@@ -0,0 +1,80 @@
+"""End-to-end revalue_all against a positions table: load, value and write back.
+
+Runs in-process against DATABASE_URL and also times the load and the vectorized pass on
+their own. Point it at a scratch database; --seed fills positions with synthetic rows
+(replacing what is there) and every run appends one portfolio_stats row per portfolio:
+
+    DATABASE_URL=postgresql://localhost/scratch python benchmarks/valuation.py \\
+        --seed --positions 1000000 --portfolios 50000 --symbols 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import text  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.valuation import load_positions, revalue_all  # noqa: E402
+
+
+async def seed(positions, portfolios, symbols):
+    async with engine.begin() as connection:
+        await connection.execute(text("TRUNCATE positions"))
+        await connection.execute(text("""
+            INSERT INTO positions (position_id, portfolio_id, portfolio_name, user_id, stock, quantity)
+            SELECT g, g % :portfolios, 'portfolio-' || g % :portfolios, g % :portfolios,
+                'SYM' || (random() * (:symbols - 1))::int, 1 + (random() * 998)::int
+            FROM generate_series(1, :positions) g
+        """), {"positions": positions, "portfolios": portfolios, "symbols": symbols})
+        await connection.execute(text("ANALYZE positions"))
+
+
+def summary(timings):
+    return f"best {min(timings) * 1000:.0f} ms, median {sorted(timings)[len(timings) // 2] * 1000:.0f} ms"
+
+
+async def run(symbols, repeat):
+    prices = {f"SYM{i}": float(p) for i, p in enumerate(np.random.default_rng(0).uniform(1, 500, symbols))}
+    loads, values, totals = [], [], []
+    for _ in range(repeat):
+        async with SessionLocal() as session:
+            start = time.perf_counter()
+            matrix = await load_positions(session)
+            loaded = time.perf_counter()
+            matrix.value(matrix.price_vector(prices))
+            values.append(time.perf_counter() - loaded)
+            loads.append(loaded - start)
+        async with SessionLocal() as session:
+            start = time.perf_counter()
+            result = await revalue_all(session, prices)
+            totals.append(time.perf_counter() - start)
+
+    print(f"{len(matrix.quantities):,} positions / {len(matrix.portfolio_ids):,} portfolios / "
+          f"{len(matrix.symbols):,} symbols, {result['valued']:,} values written per run")
+    print(f"load positions:   {summary(loads)}")
+    print(f"vectorized value: {summary(values)}")
+    print(f"revalue_all:      {summary(totals)}")
+
+
+async def main(args):
+    try:
+        if args.seed:
+            await seed(args.positions, args.portfolios, args.symbols)
+        await run(args.symbols, args.repeat)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", action="store_true", help="replace positions with synthetic rows first")
+    parser.add_argument("--positions", type=int, default=1000000)
+    parser.add_argument("--portfolios", type=int, default=50000)
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -1,9 +1 @@
-from fastapi import FastAPI
-from app.routes import health, users, portfolio
-
-app = FastAPI()
-
-# Include routers
-app.include_router(health.router)
-app.include_router(users.router)
-app.include_router(portfolio.router) 
\ No newline at end of file
+from app.main import app